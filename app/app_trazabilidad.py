@@ -31,8 +31,9 @@ if str(CORE_DIR) not in sys.path:
     sys.path.insert(0, str(CORE_DIR))
 
 import streamlit as st
+from repository_base import crear_conexion
 from repository_trazabilidad import HistorialGeneralRepository, HashRepository
-from datetime import datetime
+from datetime import datetime, timezone
 import pandas as pd
 
 # ================================================================
@@ -44,6 +45,98 @@ st.set_page_config(
     layout="wide"
 )
 
+# ================================================================
+#  Recursos cacheados
+# ================================================================
+def obtener_repositorios(usuario):
+    """
+    Repositorios del Núcleo 4 reutilizados entre reruns de la sesión actual.
+    Comparten una conexión SQLite propia de la sesión (en session_state, no en
+    cache_resource, que es global al proceso): las transacciones de distintos
+    auditores nunca se intercalan sobre la misma conexión.
+    """
+    clave = f"_repos_trazabilidad_{usuario}"
+    if clave not in st.session_state:
+        # check_same_thread=False: los reruns de una misma sesión pueden correr
+        # en hilos distintos, pero nunca a la vez
+        con = crear_conexion(check_same_thread=False)
+        st.session_state[clave] = (
+            HistorialGeneralRepository(usuario=usuario, conn=con),
+            HashRepository(usuario=usuario, conn=con)
+        )
+    return st.session_state[clave]
+
+
+def serie_ordenada(conteos, indice, columna):
+    """Convierte un dict {clave: conteo} en una Series ordenada de mayor a menor."""
+    return (
+        pd.Series(conteos, name=columna, dtype="int64")
+        .rename_axis(indice)
+        .sort_values(ascending=False)
+    )
+
+
+@st.cache_data(ttl=30)
+def estadisticas_historial(usuario):
+    """
+    Agregados de historial_general reutilizados entre reruns (TTL 30 s),
+    con los conteos ya como Series ordenadas listas para graficar.
+    """
+    repo_hist, _ = obtener_repositorios(usuario)
+    stats = repo_hist.estadisticas()
+    stats['por_entidad'] = serie_ordenada(stats['por_entidad'], 'Entidad', 'Eventos')
+    stats['por_accion'] = serie_ordenada(stats['por_accion'], 'Acción', 'Eventos')
+    stats['top_usuarios'] = serie_ordenada(stats['top_usuarios'], 'Usuario', 'Eventos')
+    return stats
+
+
+@st.cache_data(ttl=30)
+def estadisticas_hashes(usuario):
+    """
+    Agregados de hash_registros reutilizados entre reruns (TTL 30 s),
+    con los conteos ya como Series ordenadas.
+    """
+    _, repo_hash = obtener_repositorios(usuario)
+    stats = repo_hash.estadisticas()
+    stats['por_tabla'] = serie_ordenada(stats['por_tabla'], 'Tabla', 'Hashes')
+    return stats
+
+
+@st.cache_data(ttl=60)
+def linea_tiempo_cacheada(usuario, entidad, id_entidad):
+    """Línea de tiempo por (auditor, entidad, id) reutilizada entre clics (TTL 60 s)."""
+    repo_hist, _ = obtener_repositorios(usuario)
+    return repo_hist.linea_tiempo(entidad, id_entidad)
+
+
+@st.cache_data(ttl=10)
+def pagina_eventos(usuario, limite, offset, busqueda, filtro_entidad):
+    """
+    Una página del historial (búsqueda o filtro por entidad), paginada en SQL
+    y ya convertida a DataFrame (TTL 10 s). Los argumentos son escalares, así
+    que la clave de caché es barata de calcular; el DataFrame solo se arma
+    y se parsea al expirar la entrada.
+    """
+    repo_hist, _ = obtener_repositorios(usuario)
+    if busqueda:
+        eventos = repo_hist.buscar(busqueda, limite, offset=offset)
+    elif filtro_entidad != "Todas":
+        eventos = repo_hist.listar_eventos(limite, entidad=filtro_entidad, offset=offset)
+    else:
+        eventos = repo_hist.listar_eventos(limite, offset=offset)
+    return registros_a_dataframe(eventos)
+
+
+def registros_a_dataframe(registros):
+    """
+    Construye el DataFrame por registros y parsea `timestamp` una sola vez,
+    para que DatetimeColumn reciba datetimes y no vuelva a parsear cadenas.
+    """
+    df = pd.DataFrame.from_records(registros)
+    if 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'], format='ISO8601', cache=True)
+    return df
+
 # ================================================================
 #  Header
 # ================================================================
@@ -68,27 +161,43 @@ with st.sidebar:
     
     st.header("📊 Estadísticas Rápidas")
     
-    # Inicializar repositorios
-    repo_hist = HistorialGeneralRepository(usuario=usuario_actual)
-    repo_hash = HashRepository(usuario=usuario_actual)
+    # Repositorios cacheados por auditor
+    repo_hist, repo_hash = obtener_repositorios(usuario_actual)
+    
+    if st.button("🔄 Actualizar estadísticas"):
+        estadisticas_historial.clear()
+        estadisticas_hashes.clear()
     
     # Obtener estadísticas
     try:
-        stats_h = repo_hist.estadisticas()
-        stats_hash = repo_hash.estadisticas()
+        stats_h = estadisticas_historial(usuario_actual)
+        stats_hash = estadisticas_hashes(usuario_actual)
+        
+        # Compartir con las pestañas (evita recálculo y NameError si falla)
+        st.session_state['stats_h'] = stats_h
+        st.session_state['stats_hash'] = stats_hash
         
         st.metric("Total Eventos", stats_h.get('total_eventos', 0))
         st.metric("Total Hashes", stats_hash.get('total_hashes', 0))
         
-        # Auditoría rápida
+        # Auditoría rápida (el resultado persiste hasta re-ejecutar o descartar)
         if st.button("🔍 Auditoría Completa"):
             with st.spinner("Verificando integridad..."):
-                auditoria = repo_hash.auditoria_completa()
-                st.success(f"✅ OK: {auditoria['integridad_ok']}")
-                if auditoria['integridad_error'] > 0:
-                    st.error(f"❌ Errores: {auditoria['integridad_error']}")
-                if auditoria['sin_datos'] > 0:
-                    st.warning(f"⚠️ Sin datos: {auditoria['sin_datos']}")
+                st.session_state['last_audit'] = repo_hash.auditoria_completa_sql()
+                st.session_state['last_audit_ts'] = datetime.now().strftime('%H:%M:%S')
+        
+        if 'last_audit' in st.session_state:
+            auditoria = st.session_state['last_audit']
+            st.caption(f"Última auditoría: {st.session_state['last_audit_ts']}")
+            st.success(f"✅ OK: {auditoria['integridad_ok']}")
+            if auditoria['integridad_error'] > 0:
+                st.error(f"❌ Errores: {auditoria['integridad_error']}")
+            if auditoria['sin_datos'] > 0:
+                st.warning(f"⚠️ Sin datos: {auditoria['sin_datos']}")
+            if st.button("🗑️ Descartar auditoría"):
+                del st.session_state['last_audit']
+                del st.session_state['last_audit_ts']
+                st.rerun()
     except Exception as e:
         st.error(f"Error al cargar estadísticas: {e}")
 
@@ -109,7 +218,7 @@ tab1, tab2, tab3, tab4, tab5 = st.tabs([
 with tab1:
     st.subheader("📜 Historial de Eventos Recientes")
     
-    col1, col2 = st.columns([3, 1])
+    col1, col2, col3 = st.columns([3, 1, 1])
     
     with col1:
         busqueda = st.text_input(
@@ -121,30 +230,32 @@ with tab1:
     with col2:
         filtro_entidad = st.selectbox(
             "Filtrar por entidad",
-            ["Todas"] + list(stats_h.get('por_entidad', {}).keys())
+            ["Todas"] + list(st.session_state.get('stats_h', {}).get('por_entidad', {}).keys())
         )
     
+    with col3:
+        pagina = st.number_input("Página", min_value=1, value=1, step=1)
+    
     try:
-        if busqueda:
-            eventos = repo_hist.buscar(busqueda, limite)
-        elif filtro_entidad != "Todas":
-            eventos = repo_hist.listar_eventos(limite, entidad=filtro_entidad)
-        else:
-            eventos = repo_hist.listar_eventos(limite)
+        df_eventos = pagina_eventos(
+            usuario_actual, limite, (pagina - 1) * limite, busqueda, filtro_entidad
+        )
         
-        if not eventos:
-            st.warning("No hay eventos registrados aún.")
+        if df_eventos.empty:
+            st.warning("No hay eventos en esta página." if pagina > 1 else "No hay eventos registrados aún.")
         else:
-            st.info(f"📋 Mostrando {len(eventos)} eventos")
-            
-            # Convertir a DataFrame para mejor visualización
-            df_eventos = pd.DataFrame(eventos)
+            st.info(f"📋 Mostrando {len(df_eventos)} eventos (página {pagina})")
             
-            # Configurar columnas
-            st.dataframe(
+            # Configurar columnas; la fila seleccionada define el detalle. La
+            # clave depende de la página y los filtros: al cambiar el contenido
+            # de la tabla se descarta la selección anterior (índice de otra página)
+            seleccion = st.dataframe(
                 df_eventos,
                 use_container_width=True,
                 hide_index=True,
+                selection_mode="single-row",
+                on_select="rerun",
+                key=f"ev_{limite}_{pagina}_{filtro_entidad}_{busqueda}",
                 column_config={
                     "id_evento": st.column_config.NumberColumn("ID", width="small"),
                     "entidad": st.column_config.TextColumn("Entidad", width="medium"),
@@ -160,17 +271,14 @@ with tab1:
             st.divider()
             st.subheader("🔍 Detalle de Evento")
             
-            id_evento_seleccionado = st.number_input(
-                "Seleccionar ID de evento para ver detalle completo",
-                min_value=1,
-                max_value=max([e['id_evento'] for e in eventos]),
-                value=eventos[0]['id_evento'],
-                step=1
-            )
-            
-            if st.button("Ver Detalle Completo"):
+            filas = [i for i in seleccion.selection.rows if i < len(df_eventos)]
+            if not filas:
+                st.caption("Selecciona una fila de la tabla para ver el detalle completo.")
+            else:
+                fila = df_eventos.iloc[filas[0]]
+                # El listado no trae valor_anterior/valor_nuevo: se consulta solo el evento seleccionado
                 try:
-                    detalle = repo_hist.detalle_evento(id_evento_seleccionado)
+                    detalle = repo_hist.detalle_evento(int(fila['id_evento']))
                     st.json(detalle, expanded=True)
                 except ValueError as e:
                     st.error(str(e))
@@ -186,7 +294,7 @@ with tab2:
     
     filtro_tabla = st.selectbox(
         "Filtrar por tabla origen",
-        ["Todas"] + list(stats_hash.get('por_tabla', {}).keys())
+        ["Todas"] + list(st.session_state.get('stats_hash', {}).get('por_tabla', {}).keys())
     )
     
     try:
@@ -200,7 +308,7 @@ with tab2:
         else:
             st.info(f"🔐 Mostrando {len(hashes)} hashes")
             
-            df_hashes = pd.DataFrame(hashes)
+            df_hashes = registros_a_dataframe(hashes)
             
             st.dataframe(
                 df_hashes,
@@ -308,27 +416,39 @@ with tab3:
     if st.button("Ejecutar Auditoría Completa del Sistema", type="secondary"):
         with st.spinner("Auditando todos los registros..."):
             try:
-                auditoria = repo_hash.auditoria_completa()
-                
-                # Métricas principales
-                col1, col2, col3, col4 = st.columns(4)
-                
-                col1.metric("Total Verificados", auditoria['total_verificados'])
-                col2.metric("✅ Integridad OK", auditoria['integridad_ok'])
-                col3.metric("❌ Errores", auditoria['integridad_error'])
-                col4.metric("⚠️ Sin Datos", auditoria['sin_datos'])
-                
-                # Detalles de errores
-                if auditoria['integridad_error'] > 0:
-                    st.error("🚨 Se encontraron inconsistencias de integridad:")
-                    for detalle in auditoria['detalles']:
-                        with st.expander(f"❌ {detalle['tabla_origen']}[{detalle['id_registro']}]"):
-                            st.json(detalle)
-                else:
-                    st.success("✅ Todos los registros tienen integridad verificada")
-            
+                # Persistir para que la selección de filas sobreviva al rerun
+                st.session_state['auditoria_masiva'] = repo_hash.auditoria_completa_sql()
             except Exception as e:
                 st.error(f"Error en auditoría: {e}")
+    
+    if 'auditoria_masiva' in st.session_state:
+        auditoria = st.session_state['auditoria_masiva']
+        
+        # Métricas principales
+        col1, col2, col3, col4 = st.columns(4)
+        
+        col1.metric("Total Verificados", auditoria['total_verificados'])
+        col2.metric("✅ Integridad OK", auditoria['integridad_ok'])
+        col3.metric("❌ Errores", auditoria['integridad_error'])
+        col4.metric("⚠️ Sin Datos", auditoria['sin_datos'])
+        
+        # Detalles de errores en una sola tabla; el detalle JSON solo de la fila seleccionada
+        if auditoria['integridad_error'] > 0:
+            st.error("🚨 Se encontraron inconsistencias de integridad:")
+            df_det = pd.DataFrame(auditoria['detalles'])
+            seleccion = st.dataframe(
+                df_det[['tabla_origen', 'id_registro', 'hash_registro', 'hash_evento', 'mensaje']],
+                use_container_width=True,
+                hide_index=True,
+                selection_mode="single-row",
+                on_select="rerun",
+                key="audit_sel"
+            )
+            filas = seleccion.selection.rows
+            if filas:
+                st.json(auditoria['detalles'][filas[0]])
+        else:
+            st.success("✅ Todos los registros tienen integridad verificada")
 
 # ================================================================
 #  TAB 4: Línea de Tiempo
@@ -361,40 +481,54 @@ with tab4:
     if st.button("📅 Generar Línea de Tiempo", type="primary"):
         try:
             with st.spinner("Reconstruyendo historia..."):
-                linea = repo_hist.linea_tiempo(entidad_lt, id_entidad_lt)
-            
-            if not linea:
-                st.warning(f"No hay eventos registrados para {entidad_lt}[{id_entidad_lt}]")
-            else:
-                st.success(f"📅 {len(linea)} eventos encontrados")
-                
-                # Mostrar línea de tiempo
-                for i, evento in enumerate(linea):
-                    with st.container():
-                        col_tiempo, col_evento = st.columns([1, 4])
-                        
-                        with col_tiempo:
-                            st.caption(evento['timestamp'][:19])
-                            st.caption(f"ID: {evento['id_evento']}")
-                        
-                        with col_evento:
-                            st.markdown(f"**{evento['accion']}** por `{evento['usuario']}`")
-                            
-                            if evento.get('valor_nuevo'):
-                                with st.expander("Ver cambios"):
-                                    col_a, col_b = st.columns(2)
-                                    with col_a:
-                                        st.caption("Valor Anterior:")
-                                        st.code(evento.get('valor_anterior', 'N/A'), language="json")
-                                    with col_b:
-                                        st.caption("Valor Nuevo:")
-                                        st.code(evento.get('valor_nuevo', 'N/A'), language="json")
-                        
-                        if i < len(linea) - 1:
-                            st.markdown("---")
-        
+                linea = linea_tiempo_cacheada(usuario_actual, entidad_lt, id_entidad_lt)
+            # Persistir para que el selector de eventos sobreviva al rerun
+            st.session_state['linea_tiempo'] = (entidad_lt, id_entidad_lt, linea)
         except Exception as e:
             st.error(f"Error al generar línea de tiempo: {e}")
+    
+    if 'linea_tiempo' in st.session_state:
+        entidad_generada, id_generado, linea = st.session_state['linea_tiempo']
+        
+        if not linea:
+            st.warning(f"No hay eventos registrados para {entidad_generada}[{id_generado}]")
+        else:
+            st.success(f"📅 {len(linea)} eventos encontrados")
+            
+            # Línea de tiempo en una sola tabla (un elemento en lugar de N bloques)
+            df_linea = pd.DataFrame(linea)[['timestamp', 'id_evento', 'accion', 'usuario']]
+            st.dataframe(
+                df_linea,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "timestamp": st.column_config.TextColumn("Fecha/Hora", width="medium"),
+                    "id_evento": st.column_config.NumberColumn("ID", width="small"),
+                    "accion": st.column_config.TextColumn("Acción", width="medium"),
+                    "usuario": st.column_config.TextColumn("Usuario", width="small"),
+                }
+            )
+            
+            # Cambios solo del evento seleccionado
+            eventos_por_id = {evento['id_evento']: evento for evento in linea}
+            id_evento_lt = st.selectbox(
+                "Evento a inspeccionar",
+                options=list(eventos_por_id),
+                format_func=lambda x: f"ID {x} - {eventos_por_id[x]['accion']} por {eventos_por_id[x]['usuario']}"
+            )
+            evento = eventos_por_id[id_evento_lt]
+            
+            if evento.get('valor_nuevo'):
+                with st.expander("Ver cambios", expanded=True):
+                    col_a, col_b = st.columns(2)
+                    with col_a:
+                        st.caption("Valor Anterior:")
+                        st.code(evento.get('valor_anterior') or 'N/A', language="json")
+                    with col_b:
+                        st.caption("Valor Nuevo:")
+                        st.code(evento['valor_nuevo'], language="json")
+            else:
+                st.caption("Este evento no registró cambios de valores.")
 
 # ================================================================
 #  TAB 5: Estadísticas
@@ -403,8 +537,8 @@ with tab5:
     st.subheader("📊 Estadísticas de Auditoría")
     
     try:
-        stats_h = repo_hist.estadisticas()
-        stats_hash = repo_hash.estadisticas()
+        stats_h = st.session_state.get('stats_h', {})
+        stats_hash = st.session_state.get('stats_hash', {})
         
         # Métricas principales
         col1, col2 = st.columns(2)
@@ -422,23 +556,17 @@ with tab5:
         
         with col_a:
             st.subheader("Eventos por Entidad")
-            if stats_h.get('por_entidad'):
-                df_entidad = pd.DataFrame(
-                    list(stats_h['por_entidad'].items()),
-                    columns=['Entidad', 'Eventos']
-                ).sort_values('Eventos', ascending=False)
-                st.bar_chart(df_entidad.set_index('Entidad'))
+            por_entidad = stats_h.get('por_entidad')
+            if por_entidad is not None and not por_entidad.empty:
+                st.bar_chart(por_entidad)
             else:
                 st.info("Sin datos")
         
         with col_b:
             st.subheader("Eventos por Acción")
-            if stats_h.get('por_accion'):
-                df_accion = pd.DataFrame(
-                    list(stats_h['por_accion'].items()),
-                    columns=['Acción', 'Eventos']
-                ).sort_values('Eventos', ascending=False)
-                st.bar_chart(df_accion.set_index('Acción'))
+            por_accion = stats_h.get('por_accion')
+            if por_accion is not None and not por_accion.empty:
+                st.bar_chart(por_accion)
             else:
                 st.info("Sin datos")
         
@@ -446,24 +574,18 @@ with tab5:
         
         # Top usuarios
         st.subheader("Top Usuarios por Actividad")
-        if stats_h.get('top_usuarios'):
-            df_usuarios = pd.DataFrame(
-                list(stats_h['top_usuarios'].items()),
-                columns=['Usuario', 'Eventos']
-            ).sort_values('Eventos', ascending=False)
-            st.dataframe(df_usuarios, use_container_width=True, hide_index=True)
+        top_usuarios = stats_h.get('top_usuarios')
+        if top_usuarios is not None and not top_usuarios.empty:
+            st.dataframe(top_usuarios.reset_index(), use_container_width=True, hide_index=True)
         else:
             st.info("Sin datos de usuarios")
         
         # Hashes por tabla
         st.divider()
         st.subheader("Hashes por Tabla Origen")
-        if stats_hash.get('por_tabla'):
-            df_tabla = pd.DataFrame(
-                list(stats_hash['por_tabla'].items()),
-                columns=['Tabla', 'Hashes']
-            ).sort_values('Hashes', ascending=False)
-            st.dataframe(df_tabla, use_container_width=True, hide_index=True)
+        por_tabla = stats_hash.get('por_tabla')
+        if por_tabla is not None and not por_tabla.empty:
+            st.dataframe(por_tabla.reset_index(), use_container_width=True, hide_index=True)
         else:
             st.info("Sin datos de hashes")
     
@@ -473,9 +595,13 @@ with tab5:
 # ================================================================
 #  Footer
 # ================================================================
+# Marca de tiempo formateada una vez por sesión: el caption no cambia entre reruns
+if 'boot_ts' not in st.session_state:
+    st.session_state['boot_ts'] = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
 st.divider()
 st.caption(f"""
 📘 **CRM-EXO v2** | Núcleo 4 - Trazabilidad Estructural  
 🔐 Auditoría forense con verificación SHA-256  
-⏰ Última actualización: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC
+⏰ Sesión iniciada: {st.session_state['boot_ts']} UTC
 """)
@@ -8,8 +8,13 @@
 
 import streamlit as st
 import sqlite3
+import os
+import queue
 import hashlib
+import logging
+import secrets
 from datetime import datetime, date
+from contextlib import contextmanager
 import pandas as pd
 from pathlib import Path
 from decimal import Decimal
@@ -23,20 +28,75 @@ DB_PATH = BASE_DIR / "crm_exo_v2" / "data" / "crm_exo_v2.sqlite"
 sys.path.insert(0, str(BASE_DIR / "crm_exo_v2" / "core"))
 sys.path.insert(0, str(BASE_DIR / "crm_exo_v2" / "ui"))
 
+import lectura_arrow
+from transacciones import transaccion_escritura
+from resumen_pipeline import RESUMEN_PIPELINE
+
+logger = logging.getLogger(__name__)
+
 # Importar módulos de facturación CFDI
-try:
-    from ui_cfdi_emisor import ui_registro_emisor, widget_estado_cfdi
-    from facturacion.cfdi_emisor import validar_configuracion_cfdi, obtener_configuracion_emisor
-    CFDI_DISPONIBLE = True
-except ImportError as e:
-    CFDI_DISPONIBLE = False
-    print(f"⚠️ Módulo CFDI no disponible: {e}")
+@st.cache_resource
+def cargar_cfdi():
+    """Importa los módulos CFDI una sola vez por proceso (también el fallo:
+    no se reintenta el import ni se repite el aviso en cada rerun).
+    Retorna la tupla de funciones o None si no están disponibles"""
+    try:
+        from ui_cfdi_emisor import ui_registro_emisor, widget_estado_cfdi
+        from facturacion.cfdi_emisor import validar_configuracion_cfdi, obtener_configuracion_emisor
+    except ImportError as e:
+        print(f"⚠️ Módulo CFDI no disponible: {e}")
+        return None
+    return ui_registro_emisor, widget_estado_cfdi, validar_configuracion_cfdi, obtener_configuracion_emisor
+
+
+# Lectura columnar opcional (adbc-driver-sqlite + pyarrow)
+@st.cache_resource
+def lector_arrow():
+    """Conexión ADBC de lectura, abierta una sola vez por proceso (las consultas
+    se serializan dentro de LectorArrow). None si el driver no está instalado
+    o no se pudo abrir: se usa pd.read_sql sobre el pool de lectura"""
+    if not lectura_arrow.disponible():
+        return None
+    try:
+        return lectura_arrow.LectorArrow(DB_PATH)
+    except lectura_arrow.LectorArrow.Error as e:
+        logger.warning("No se pudo abrir la conexión ADBC, se usa pd.read_sql: %s", e)
+        return None
 
 
 # ================================================================
 #  INICIALIZACIÓN Y CONEXIÓN
 # ================================================================
 
+# Versión del schema (PRAGMA user_version) alcanzada tras aplicar_migraciones();
+# incrementar al agregar una migración nueva
+SCHEMA_VERSION = 7
+
+# Índices para estadísticas (GROUP BY) y listados ordenados por timestamp
+# de la trazabilidad; se aplican al crear la base y en aplicar_migraciones()
+INDICES_TRAZABILIDAD = """
+    CREATE INDEX IF NOT EXISTS idx_historial_ts ON historial_general(timestamp DESC);
+    CREATE INDEX IF NOT EXISTS idx_historial_entidad_ts ON historial_general(entidad, timestamp DESC);
+    CREATE INDEX IF NOT EXISTS idx_historial_accion ON historial_general(accion);
+    CREATE INDEX IF NOT EXISTS idx_historial_usuario ON historial_general(usuario);
+    CREATE INDEX IF NOT EXISTS idx_hash_tabla_ts ON hash_registros(tabla_origen, timestamp DESC);
+    CREATE INDEX IF NOT EXISTS idx_historial_entidad_accion_ts ON historial_general(entidad, accion, timestamp DESC);
+"""
+
+# Índices para las consultas del Dashboard y N1/N2: conteos por es_cliente,
+# últimos prospectos, pipeline por etapa, listados por fecha de creación y
+# los LEFT JOIN por empresa/prospecto del Pipeline Visual
+INDICES_DASHBOARD = """
+    CREATE INDEX IF NOT EXISTS idx_prospectos_cliente_fecha ON prospectos(es_cliente, fecha_creacion DESC);
+    CREATE INDEX IF NOT EXISTS idx_oportunidades_etapa ON oportunidades(etapa);
+    CREATE INDEX IF NOT EXISTS idx_oportunidades_fecha ON oportunidades(fecha_creacion DESC);
+    CREATE INDEX IF NOT EXISTS idx_empresas_nombre_nocase ON empresas(nombre COLLATE NOCASE);
+    CREATE INDEX IF NOT EXISTS idx_empresas_alta ON empresas(fecha_alta DESC);
+    CREATE INDEX IF NOT EXISTS idx_prospectos_empresa_cliente ON prospectos(id_empresa, es_cliente);
+    CREATE INDEX IF NOT EXISTS idx_oportunidades_prospecto_etapa ON oportunidades(id_prospecto, etapa);
+"""
+
+
 def inicializar_db():
     """Crea la base de datos si no existe"""
     if DB_PATH.exists():
@@ -51,7 +111,7 @@ def inicializar_db():
     cur.executescript("""
     CREATE TABLE IF NOT EXISTS empresas (
         id_empresa INTEGER PRIMARY KEY AUTOINCREMENT,
-        nombre TEXT NOT NULL,
+        nombre TEXT NOT NULL COLLATE NOCASE,
         rfc TEXT,
         sector TEXT,
         telefono TEXT,
@@ -165,31 +225,398 @@ def inicializar_db():
     CREATE INDEX IF NOT EXISTS idx_historial_entidad ON historial_general(entidad, id_entidad);
     CREATE INDEX IF NOT EXISTS idx_hash_origen ON hash_registros(tabla_origen, id_registro);
     """)
+    cur.executescript(INDICES_TRAZABILIDAD)
+    cur.executescript(INDICES_DASHBOARD)
+    cur.executescript(RESUMEN_PIPELINE)
+    cur.execute("ANALYZE")
     
     con.commit()
     con.close()
 
 
-def conectar():
+# PRAGMAs por conexión: escrituras del historial/hash sin fsync por commit
+# y lecturas servidas desde caché de páginas / mmap
+PRAGMAS_CONEXION = """
+    PRAGMA foreign_keys = ON;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA cache_size = -65536;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA busy_timeout = 5000;
+"""
+
+
+@st.cache_resource
+def activar_wal():
+    """Activa journal_mode=WAL (persistente en el archivo) una vez por proceso"""
     inicializar_db()
     con = sqlite3.connect(str(DB_PATH))
-    con.row_factory = sqlite3.Row
-    con.execute("PRAGMA foreign_keys = ON")
+    modo = con.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+    con.close()
+    return modo
+
+
+def conectar():
+    """Conexión única por sesión de Streamlit (se abre y configura una sola vez).
+    Las llamadas no deben cerrarla: la reutilizan todas las secciones y reruns"""
+    con = st.session_state.get("_conexion_db")
+    if con is None:
+        inicializar_db()
+        activar_wal()
+        # check_same_thread=False: los reruns de una sesión pueden correr en hilos distintos
+        con = sqlite3.connect(str(DB_PATH), check_same_thread=False, cached_statements=256)
+        con.row_factory = sqlite3.Row
+        con.executescript(PRAGMAS_CONEXION)
+        st.session_state["_conexion_db"] = con
     return con
 
 
+@st.cache_resource
+def pool_lectura():
+    """Conexiones de solo lectura (mode=ro) compartidas por el proceso para las
+    consultas cacheadas; con WAL leen en paralelo sin esperar al escritor"""
+    activar_wal()
+    pool = queue.Queue()
+    for _ in range(max(4, os.cpu_count() or 1)):
+        con = sqlite3.connect(f"{DB_PATH.as_uri()}?mode=ro", uri=True,
+                              check_same_thread=False, cached_statements=256)
+        con.row_factory = sqlite3.Row
+        con.executescript(PRAGMAS_CONEXION)
+        pool.put(con)
+    return pool
+
+
+@contextmanager
+def conexion_lectura():
+    """Toma prestada una conexión de solo lectura del pool y la devuelve al salir"""
+    pool = pool_lectura()
+    con = pool.get()
+    try:
+        yield con
+    finally:
+        pool.put(con)
+
+
+def filas_dict(con, sql, params=()):
+    """Filas como lista de dicts para st.dataframe (listados cortos, sin pandas)"""
+    cur = con.execute(sql, params)
+    columnas = [d[0] for d in cur.description]
+    return [dict(zip(columnas, fila)) for fila in cur.fetchall()]
+
+
+def leer_tabla(sql, params=()):
+    """DataFrame de una consulta de listado. Con ADBC disponible el resultado se
+    decodifica en columnas Arrow (sin un objeto Python por celda); si no, pd.read_sql"""
+    lector = lector_arrow()
+    if lector is not None:
+        try:
+            return lector.leer(sql, params)
+        except lector.Error as e:
+            logger.warning("Lectura ADBC falló, se usa pd.read_sql: %s", e)
+    with conexion_lectura() as con:
+        return pd.read_sql(sql, con, params=params)
+
+
+def leer_filas(sql, params=()):
+    """Filas (sqlite3.Row) de una consulta sobre una conexión de solo lectura del pool"""
+    with conexion_lectura() as con:
+        return con.execute(sql, params).fetchall()
+
+
+def hash_many(raws):
+    """Calcula el SHA-256 (hex) de cada cadena cruda en un solo recorrido"""
+    return [hashlib.sha256(r.encode()).hexdigest() for r in raws]
+
+
+# INSERT de evento con texto fijo (sentencia preparada reutilizada)
+_SQL_INSERT_EVENTO = """
+    INSERT INTO historial_general
+    (entidad, id_entidad, accion, valor_nuevo, usuario, timestamp, hash_evento)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def registrar_eventos(con, eventos, usuario="ui"):
+    """Registra en lote eventos (entidad, id_entidad, accion, valor_nuevo)
+    con hash forense en un solo executemany. No hace commit: el llamador
+    confirma (p. ej. dentro de transaccion_escritura)"""
+    ts = datetime.now().isoformat()
+    hashes = hash_many(f"{entidad}|{accion}|{valor_nuevo}|{ts}"
+                       for entidad, _, accion, valor_nuevo in eventos)
+    con.executemany(_SQL_INSERT_EVENTO, [
+        (entidad, id_entidad, accion, valor_nuevo, usuario, ts, h)
+        for (entidad, id_entidad, accion, valor_nuevo), h in zip(eventos, hashes)
+    ])
+    return hashes
+
+
 def registrar_evento(con, entidad, id_entidad, accion, valor_nuevo, usuario="ui"):
-    """Registra evento con hash forense"""
+    """Registra evento con hash forense. No hace commit: el llamador confirma
+    (p. ej. dentro de transaccion_escritura)"""
     ts = datetime.now().isoformat()
-    raw = f"{entidad}|{accion}|{valor_nuevo}|{ts}"
-    h = hashlib.sha256(raw.encode()).hexdigest()
-    con.execute("""
-        INSERT INTO historial_general
-        (entidad, id_entidad, accion, valor_nuevo, usuario, timestamp, hash_evento)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (entidad, id_entidad, accion, valor_nuevo, usuario, ts, h))
-    con.commit()
-    return h
+    hash_evento = hashlib.sha256(f"{entidad}|{accion}|{valor_nuevo}|{ts}".encode()).hexdigest()
+    con.execute(_SQL_INSERT_EVENTO, (entidad, id_entidad, accion, valor_nuevo, usuario, ts, hash_evento))
+    return hash_evento
+
+
+def token_envio(formulario, enviado):
+    """Token de idempotencia del envío en curso del formulario (session_state).
+    Se renueva en la primera ejecución sin submit después de guardar: un rerun
+    que repite el mismo submit conserva el token ya guardado, y un segundo envío
+    deliberado (aunque repita los valores) lleva un token nuevo"""
+    clave = f"_token_{formulario}"
+    if clave not in st.session_state or (not enviado and envio_repetido(formulario, st.session_state[clave])):
+        st.session_state[clave] = secrets.token_hex(16)
+    return st.session_state[clave]
+
+
+def envio_repetido(formulario, token):
+    """True si el envío con este token ya se guardó en la sesión"""
+    return st.session_state.get(f"_envio_{formulario}") == token
+
+
+def envio_nuevo(formulario, token):
+    """True si el envío aún no se guardó; si ya se guardó lo avisa en lugar
+    de descartarlo en silencio"""
+    if envio_repetido(formulario, token):
+        st.info("ℹ️ Este envío ya se guardó; no se registró de nuevo.")
+        return False
+    return True
+
+
+def marcar_envio(formulario, token):
+    """Recuerda el token del último envío guardado del formulario"""
+    st.session_state[f"_envio_{formulario}"] = token
+
+
+# ================================================================
+#  CONSULTAS CACHEADAS DEL DASHBOARD
+# ================================================================
+
+# Sentencias del Dashboard como constantes de módulo: el mismo texto SQL
+# reutiliza la sentencia preparada en la caché de la conexión de la sesión
+_SQL_METRICAS = """
+    SELECT
+        (SELECT COUNT(*) FROM empresas) AS empresas,
+        (SELECT COUNT(*) FROM prospectos WHERE es_cliente=0) AS prospectos,
+        (SELECT COUNT(*) FROM oportunidades WHERE etapa NOT IN ('Ganada','Perdida')) AS oportunidades,
+        (SELECT COUNT(*) FROM prospectos WHERE es_cliente=1) AS clientes
+"""
+
+_SQL_PIPELINE = """
+    SELECT 
+        o.etapa,
+        COUNT(*) as cantidad,
+        ROUND(SUM(o.monto_estimado), 2) as monto_total,
+        ROUND(AVG(o.probabilidad), 1) as prob_promedio
+    FROM oportunidades o
+    WHERE o.etapa NOT IN ('Perdida')
+    GROUP BY o.etapa
+"""
+
+_SQL_PROSPECTOS_RECIENTES = """
+    SELECT p.id_prospecto, e.nombre as empresa, c.nombre as contacto,
+           p.estado, p.fecha_creacion
+    FROM prospectos p
+    JOIN empresas e ON e.id_empresa = p.id_empresa
+    JOIN contactos c ON c.id_contacto = p.id_contacto
+    WHERE p.es_cliente = 0
+    ORDER BY p.fecha_creacion DESC
+    LIMIT 5
+"""
+
+_SQL_OPORTUNIDADES_ACTIVAS = """
+    SELECT o.id_oportunidad, o.nombre, o.etapa, o.probabilidad,
+           ROUND(o.monto_estimado, 2) as monto
+    FROM oportunidades o
+    WHERE o.etapa NOT IN ('Ganada', 'Perdida')
+    ORDER BY o.probabilidad DESC, o.monto_estimado DESC
+    LIMIT 5
+"""
+
+
+# Orden del embudo comercial para mostrar el pipeline
+ORDEN_ETAPAS = ["Calificación", "Propuesta", "Negociación", "Cierre", "Ganada"]
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def cargar_dashboard():
+    """
+    Datos completos del Dashboard en una sola entrada de caché (TTL 30 s).
+    
+    Returns:
+        Tupla (metricas, pipeline, prospectos_recientes, oportunidades_activas)
+    """
+    with conexion_lectura() as con:
+        metricas = dict(con.execute(_SQL_METRICAS).fetchone())
+    
+    pipeline = leer_tabla(_SQL_PIPELINE)
+    # Etapas fuera del embudo conocido se conservan al final
+    extras = sorted(set(pipeline["etapa"].dropna()) - set(ORDEN_ETAPAS))
+    pipeline["etapa"] = pd.Categorical(pipeline["etapa"], categories=ORDEN_ETAPAS + extras, ordered=True)
+    pipeline = pipeline.sort_values("etapa", ignore_index=True)
+    
+    prospectos_recientes = leer_tabla(_SQL_PROSPECTOS_RECIENTES)
+    
+    opor_activas = leer_tabla(_SQL_OPORTUNIDADES_ACTIVAS)
+    
+    return metricas, pipeline, prospectos_recientes, opor_activas
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def cargar_flujo_completo():
+    """Flujo por empresa (contactos → prospectos → oportunidades → ganado) para Pipeline Visual,
+    leído del resumen mantenido por triggers (TTL 30 s)"""
+    return leer_tabla("""
+        SELECT id_empresa, empresa, contactos, prospectos, prospectos_activos,
+               clientes, oportunidades, ganadas, monto_ganado
+        FROM resumen_pipeline
+        ORDER BY monto_ganado DESC, oportunidades DESC
+    """)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def cargar_embudo_conversion():
+    """Totales del embudo de conversión (empresas, prospectos, oportunidades, clientes)
+    en una sola consulta (TTL 30 s)"""
+    with conexion_lectura() as con:
+        return tuple(con.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM empresas),
+                (SELECT COUNT(*) FROM prospectos WHERE es_cliente=0),
+                (SELECT COUNT(*) FROM oportunidades WHERE etapa NOT IN ('Perdida')),
+                (SELECT COUNT(*) FROM prospectos WHERE es_cliente=1)
+        """).fetchone())
+
+
+def invalidar_dashboard():
+    """Invalida los datos cacheados del Dashboard y del Pipeline Visual tras una escritura"""
+    cargar_dashboard.clear()
+    cargar_flujo_completo.clear()
+    cargar_embudo_conversion.clear()
+
+
+# ================================================================
+#  LISTADOS CACHEADOS DE N1/N2
+# ================================================================
+
+_SQL_EMPRESAS = """
+    SELECT e.id_empresa, e.nombre, e.rfc, e.sector,
+           (SELECT COUNT(*) FROM contactos c WHERE c.id_empresa = e.id_empresa) as contactos
+    FROM empresas e
+    ORDER BY e.fecha_alta DESC
+"""
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def listar_empresas():
+    """Empresas con su número de contactos (TTL 10 s)"""
+    return leer_tabla(_SQL_EMPRESAS)
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def listar_contactos():
+    """Últimos 10 contactos con su empresa (TTL 10 s)"""
+    return leer_tabla("""
+        SELECT c.id_contacto, e.nombre as empresa, c.nombre, c.correo, c.puesto
+        FROM contactos c
+        JOIN empresas e ON e.id_empresa = c.id_empresa
+        ORDER BY c.fecha_alta DESC
+        LIMIT 10
+    """)
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def listar_prospectos():
+    """Últimos 10 prospectos activos (no clientes) (TTL 10 s)"""
+    return leer_tabla("""
+        SELECT p.id_prospecto, e.nombre as empresa, c.nombre as contacto,
+               p.estado, p.origen, p.fecha_creacion
+        FROM prospectos p
+        JOIN empresas e ON e.id_empresa = p.id_empresa
+        JOIN contactos c ON c.id_contacto = p.id_contacto
+        WHERE p.es_cliente = 0
+        ORDER BY p.fecha_creacion DESC
+        LIMIT 10
+    """).astype({"empresa": "category", "estado": "category"})
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def listar_oportunidades():
+    """Últimas 10 oportunidades con su empresa (TTL 10 s)"""
+    return leer_tabla("""
+        SELECT o.id_oportunidad, o.nombre, o.etapa, o.probabilidad,
+               ROUND(o.monto_estimado, 2) as monto, o.oc_recibida,
+               e.nombre as empresa
+        FROM oportunidades o
+        JOIN prospectos p ON p.id_prospecto = o.id_prospecto
+        JOIN empresas e ON e.id_empresa = p.id_empresa
+        ORDER BY o.fecha_creacion DESC
+        LIMIT 10
+    """).astype({"etapa": "category", "empresa": "category"})
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def listar_cotizaciones():
+    """Últimas 10 cotizaciones con su oportunidad (TTL 10 s)"""
+    return leer_tabla("""
+        SELECT c.id_cotizacion, o.nombre as oportunidad, c.modo, 
+               ROUND(c.monto_total, 2) as monto, c.moneda, c.estado, c.version,
+               substr(c.hash_integridad, 1, 16) as hash
+        FROM cotizaciones c
+        JOIN oportunidades o ON o.id_oportunidad = c.id_oportunidad
+        ORDER BY c.fecha_creacion DESC
+        LIMIT 10
+    """).astype({"modo": "category", "moneda": "category", "estado": "category"})
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def opciones_empresas():
+    """Selector de empresas: nombre → id_empresa (TTL 60 s)"""
+    return {r["nombre"]: r["id_empresa"] for r in
+            leer_filas("SELECT id_empresa, nombre FROM empresas ORDER BY nombre")}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def opciones_empresas_con_contactos():
+    """Selector de empresas con al menos un contacto (REGLA R1): nombre → id_empresa (TTL 60 s)"""
+    return {r["nombre"]: r["id_empresa"] for r in leer_filas("""
+        SELECT e.id_empresa, e.nombre
+        FROM empresas e
+        WHERE EXISTS (SELECT 1 FROM contactos c WHERE c.id_empresa = e.id_empresa)
+        ORDER BY e.nombre
+    """)}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def opciones_contactos(id_empresa):
+    """Contactos de una empresa como lista de (etiqueta, id_contacto) (TTL 60 s)"""
+    return [(f"{r['nombre']} ({r['puesto']})" if r['puesto'] else r['nombre'], r["id_contacto"])
+            for r in leer_filas(
+                "SELECT id_contacto, nombre, puesto FROM contactos WHERE id_empresa = ?",
+                (id_empresa,))]
+
+
+def invalidar_listados():
+    """Invalida los listados y selectores cacheados de N1/N2 tras una escritura"""
+    for listado in (listar_empresas, listar_contactos, listar_prospectos,
+                    listar_oportunidades, listar_cotizaciones,
+                    opciones_empresas, opciones_empresas_con_contactos, opciones_contactos):
+        listado.clear()
+
+
+# Filtro del historial N4 con predicados "NULL = sin filtro": un único texto SQL
+# para todas las combinaciones de filtros, así se reutiliza la sentencia preparada.
+# Sólo las columnas que muestra la tabla, con el hash ya truncado en SQL
+_SQL_HISTORIAL = """
+    SELECT id_evento, entidad, id_entidad, accion, valor_nuevo, usuario, timestamp,
+           substr(hash_evento, 1, 16) AS hash_corto
+    FROM historial_general
+    WHERE (:ent IS NULL OR entidad = :ent)
+      AND (:acc IS NULL OR accion = :acc)
+    ORDER BY timestamp DESC
+    LIMIT :lim
+"""
 
 
 # ================================================================
@@ -203,8 +630,6 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Inicializar base de datos al arrancar la aplicación
-inicializar_db()
 # Aplicar migraciones pendientes en bases existentes (columnas nuevas, etc.)
 def aplicar_migraciones():
     """Revisa y aplica pequeñas migraciones necesarias en bases existentes.
@@ -213,28 +638,35 @@ def aplicar_migraciones():
     con = sqlite3.connect(str(DB_PATH))
     cur = con.cursor()
 
-    def _column_exists(table: str, column: str) -> bool:
+    def _columnas(table: str) -> set:
         cur.execute(f"PRAGMA table_info({table})")
-        rows = cur.fetchall()
-        cols = [r[1] for r in rows]
-        return column in cols
+        return {r[1] for r in cur.fetchall()}
 
-    # Asegurar columna es_cliente en prospectos (agregada en versiones recientes)
     try:
-        if not _column_exists('prospectos', 'es_cliente'):
+        # Base ya migrada: evitar los PRAGMA table_info y CREATE de cada arranque
+        # (dentro del try: el finally cierra la conexión también en este caso)
+        if cur.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        # Asegurar columna es_cliente en prospectos (agregada en versiones recientes)
+        # Una sola introspección por tabla
+        p_cols = _columnas('prospectos')
+        o_cols = _columnas('oportunidades')
+        
+        if 'es_cliente' not in p_cols:
             cur.execute("ALTER TABLE prospectos ADD COLUMN es_cliente INTEGER DEFAULT 0")
             con.commit()
         
-        if not _column_exists('prospectos', 'fecha_conversion_cliente'):
+        if 'fecha_conversion_cliente' not in p_cols:
             cur.execute("ALTER TABLE prospectos ADD COLUMN fecha_conversion_cliente TEXT")
             con.commit()
         
         # Asegurar columna oc_recibida en oportunidades
-        if not _column_exists('oportunidades', 'oc_recibida'):
+        if 'oc_recibida' not in o_cols:
             cur.execute("ALTER TABLE oportunidades ADD COLUMN oc_recibida INTEGER DEFAULT 0")
             con.commit()
         
-        if not _column_exists('oportunidades', 'fecha_estimada_cierre'):
+        if 'fecha_estimada_cierre' not in o_cols:
             cur.execute("ALTER TABLE oportunidades ADD COLUMN fecha_estimada_cierre TEXT")
             con.commit()
         
@@ -269,6 +701,18 @@ def aplicar_migraciones():
             )
         """)
         con.commit()
+        
+        # Índices de trazabilidad y Dashboard para bases creadas antes de incluirlos
+        cur.executescript(INDICES_TRAZABILIDAD)
+        cur.executescript(INDICES_DASHBOARD)
+        # Resumen del Pipeline Visual (tabla + triggers) y carga inicial
+        cur.executescript(RESUMEN_PIPELINE)
+        cur.execute("ANALYZE")
+        con.commit()
+        
+        # Marcar la base como migrada (solo si todo lo anterior se aplicó)
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        con.commit()
             
     except Exception:
         # No hacemos fail-hard: registramos y seguimos (Streamlit ocultará detalles en producción)
@@ -277,9 +721,23 @@ def aplicar_migraciones():
     finally:
         con.close()
 
-aplicar_migraciones()
+@st.cache_resource
+def preparar_base_datos():
+    """Inicializa la base y aplica migraciones una sola vez por proceso,
+    no en cada rerun de Streamlit"""
+    inicializar_db()
+    aplicar_migraciones()
+    return True
 
-# CSS personalizado
+
+preparar_base_datos()
+
+modulos_cfdi = cargar_cfdi()
+CFDI_DISPONIBLE = modulos_cfdi is not None
+if CFDI_DISPONIBLE:
+    ui_registro_emisor, widget_estado_cfdi, validar_configuracion_cfdi, obtener_configuracion_emisor = modulos_cfdi
+
+# CSS personalizado (se emite en cada rerun: Streamlit retira los elementos no re-renderizados)
 st.markdown("""
 <style>
     .main-header {
@@ -368,30 +826,25 @@ with st.sidebar:
 #  DASHBOARD PRINCIPAL
 # ================================================================
 
-if menu == "🏠 Dashboard":
-    st.markdown('<div class="main-header">🏠 Dashboard CRM-EXO v2</div>', unsafe_allow_html=True)
-    
-    con = conectar()
-    
-    # Métricas principales con manejo de errores
+@st.fragment(run_every=30)
+def panel_metricas_dashboard():
+    """Métricas principales; se refresca sola sin re-ejecutar el script completo"""
     col1, col2, col3, col4 = st.columns(4)
     
     try:
+        metricas = cargar_dashboard()[0]
+        
         with col1:
-            total_empresas = pd.read_sql("SELECT COUNT(*) as total FROM empresas", con).iloc[0]["total"]
-            st.metric("🏢 Empresas", total_empresas)
+            st.metric("🏢 Empresas", metricas["empresas"])
         
         with col2:
-            total_prospectos = pd.read_sql("SELECT COUNT(*) as total FROM prospectos WHERE es_cliente=0", con).iloc[0]["total"]
-            st.metric("📈 Prospectos", total_prospectos)
+            st.metric("📈 Prospectos", metricas["prospectos"])
         
         with col3:
-            total_oportunidades = pd.read_sql("SELECT COUNT(*) as total FROM oportunidades WHERE etapa NOT IN ('Ganada','Perdida')", con).iloc[0]["total"]
-            st.metric("🎯 Oportunidades", total_oportunidades)
+            st.metric("🎯 Oportunidades", metricas["oportunidades"])
         
         with col4:
-            total_clientes = pd.read_sql("SELECT COUNT(*) as total FROM prospectos WHERE es_cliente=1", con).iloc[0]["total"]
-            st.metric("✅ Clientes", total_clientes)
+            st.metric("✅ Clientes", metricas["clientes"])
     
     except Exception as e:
         st.error(f"❌ Error al cargar métricas del dashboard. Por favor contacta al administrador.")
@@ -399,39 +852,14 @@ if menu == "🏠 Dashboard":
         import traceback, sys
         traceback.print_exc(file=sys.stderr)
         st.stop()
-    
-    st.divider()
-    
-    # Widget de estado CFDI
-    if CFDI_DISPONIBLE:
-        try:
-            widget_estado_cfdi()
-            st.divider()
-        except Exception:
-            pass  # Si falla el widget, no romper el dashboard
-    
-    # Pipeline por etapa
+
+
+@st.fragment(run_every=30)
+def panel_pipeline_dashboard():
+    """Pipeline por etapa y últimas actividades, refrescados junto con su caché"""
     st.subheader("📊 Pipeline de Oportunidades")
     
-    pipeline = pd.read_sql("""
-        SELECT 
-            o.etapa,
-            COUNT(*) as cantidad,
-            ROUND(SUM(o.monto_estimado), 2) as monto_total,
-            ROUND(AVG(o.probabilidad), 1) as prob_promedio
-        FROM oportunidades o
-        WHERE o.etapa NOT IN ('Perdida')
-        GROUP BY o.etapa
-        ORDER BY 
-            CASE o.etapa
-                WHEN 'Calificación' THEN 1
-                WHEN 'Propuesta' THEN 2
-                WHEN 'Negociación' THEN 3
-                WHEN 'Cierre' THEN 4
-                WHEN 'Ganada' THEN 5
-            END
-    """, con)
-    
+    _, pipeline, prospectos_recientes, opor_activas = cargar_dashboard()
     if len(pipeline) > 0:
         col_pipe1, col_pipe2 = st.columns(2)
         
@@ -448,9 +876,8 @@ if menu == "🏠 Dashboard":
             )
         
         with col_pipe2:
-            # Gráfico simple de barras con st.bar_chart
-            chart_data = pipeline.set_index('etapa')['monto_total']
-            st.bar_chart(chart_data)
+            # Gráfico simple de barras con st.bar_chart (columnas directas, sin reindexar)
+            st.bar_chart(pipeline, x="etapa", y="monto_total")
     else:
         st.info("No hay oportunidades activas. Crea la primera en N2: Transacción")
     
@@ -461,17 +888,6 @@ if menu == "🏠 Dashboard":
     
     with col_act1:
         st.subheader("📋 Últimos Prospectos")
-        prospectos_recientes = pd.read_sql("""
-            SELECT p.id_prospecto, e.nombre as empresa, c.nombre as contacto,
-                   p.estado, p.fecha_creacion
-            FROM prospectos p
-            JOIN empresas e ON e.id_empresa = p.id_empresa
-            JOIN contactos c ON c.id_contacto = p.id_contacto
-            WHERE p.es_cliente = 0
-            ORDER BY p.fecha_creacion DESC
-            LIMIT 5
-        """, con)
-        
         if len(prospectos_recientes) > 0:
             st.dataframe(prospectos_recientes, use_container_width=True, hide_index=True)
         else:
@@ -479,21 +895,30 @@ if menu == "🏠 Dashboard":
     
     with col_act2:
         st.subheader("🎯 Oportunidades Activas")
-        opor_activas = pd.read_sql("""
-            SELECT o.id_oportunidad, o.nombre, o.etapa, o.probabilidad,
-                   ROUND(o.monto_estimado, 2) as monto
-            FROM oportunidades o
-            WHERE o.etapa NOT IN ('Ganada', 'Perdida')
-            ORDER BY o.probabilidad DESC, o.monto_estimado DESC
-            LIMIT 5
-        """, con)
-        
         if len(opor_activas) > 0:
             st.dataframe(opor_activas, use_container_width=True, hide_index=True)
         else:
             st.info("No hay oportunidades activas")
+
+
+if menu == "🏠 Dashboard":
+    st.markdown('<div class="main-header">🏠 Dashboard CRM-EXO v2</div>', unsafe_allow_html=True)
     
-    con.close()
+    # Métricas principales con manejo de errores
+    panel_metricas_dashboard()
+    
+    st.divider()
+    
+    # Widget de estado CFDI
+    if CFDI_DISPONIBLE:
+        try:
+            widget_estado_cfdi()
+            st.divider()
+        except Exception:
+            pass  # Si falla el widget, no romper el dashboard
+    
+    # Pipeline por etapa y últimas actividades
+    panel_pipeline_dashboard()
 
 
 # ================================================================
@@ -521,32 +946,26 @@ elif menu == "🏗️ N1: Identidad":
                 correo = st.text_input("Correo")
                 submit = st.form_submit_button("✅ Registrar Empresa")
             
-            if submit and nombre:
+            token_empresa = token_envio("empresa", submit)
+            if submit and nombre and envio_nuevo("empresa", token_empresa):
                 con = conectar()
                 cur = con.cursor()
-                cur.execute("SELECT COUNT(*) as total FROM empresas WHERE LOWER(nombre) = LOWER(?)", (nombre,))
-                if cur.fetchone()["total"] > 0:
+                if con.execute("SELECT 1 FROM empresas WHERE nombre = ? COLLATE NOCASE LIMIT 1", (nombre,)).fetchone():
                     st.error(f"❌ Ya existe '{nombre}'")
                 else:
-                    cur.execute("INSERT INTO empresas (nombre, rfc, sector, telefono, correo) VALUES (?, ?, ?, ?, ?)",
-                               (nombre, rfc, sector, telefono, correo))
-                    con.commit()
-                    registrar_evento(con, "empresa", cur.lastrowid, "CREAR", f"Empresa: {nombre}")
+                    # Alta y evento en una sola transacción: commit único o rollback conjunto
+                    with transaccion_escritura(con):
+                        cur.execute("INSERT INTO empresas (nombre, rfc, sector, telefono, correo) VALUES (?, ?, ?, ?, ?)",
+                                   (nombre, rfc, sector, telefono, correo))
+                        registrar_evento(con, "empresa", cur.lastrowid, "CREAR", f"Empresa: {nombre}")
+                    invalidar_listados()
+                    marcar_envio("empresa", token_empresa)
+                    invalidar_dashboard()
                     st.success(f"✅ Empresa '{nombre}' creada")
                     st.rerun()
-                con.close()
         
         with col2:
-            con = conectar()
-            empresas = pd.read_sql("""
-                SELECT e.id_empresa, e.nombre, e.rfc, e.sector,
-                       COUNT(c.id_contacto) as contactos
-                FROM empresas e
-                LEFT JOIN contactos c ON c.id_empresa = e.id_empresa
-                GROUP BY e.id_empresa
-                ORDER BY e.fecha_alta DESC
-            """, con)
-            con.close()
+            empresas = listar_empresas()
             
             if len(empresas) > 0:
                 st.dataframe(empresas, use_container_width=True, hide_index=True)
@@ -557,46 +976,41 @@ elif menu == "🏗️ N1: Identidad":
     with tab2:
         st.subheader("Gestión de Contactos")
         
-        con = conectar()
-        empresas_list = pd.read_sql("SELECT id_empresa, nombre FROM empresas ORDER BY nombre", con)
-        con.close()
+        # Selector: nombre → id, sin DataFrame intermedio
+        empresas_ids = opciones_empresas()
         
-        if len(empresas_list) == 0:
+        if not empresas_ids:
             st.warning("⚠️ Primero registra una empresa")
         else:
             col1, col2 = st.columns([1, 1])
             
             with col1:
                 with st.form("form_contacto"):
-                    empresa_sel = st.selectbox("Empresa *", empresas_list["nombre"].tolist())
-                    id_empresa = int(empresas_list[empresas_list["nombre"]==empresa_sel]["id_empresa"].iloc[0])
+                    empresa_sel = st.selectbox("Empresa *", list(empresas_ids))
+                    id_empresa = empresas_ids[empresa_sel]
                     nombre_c = st.text_input("Nombre *", placeholder="Juan Pérez")
                     correo_c = st.text_input("Correo *", placeholder="juan@empresa.com")
                     telefono_c = st.text_input("Teléfono")
                     puesto_c = st.text_input("Puesto")
                     submit_c = st.form_submit_button("✅ Registrar Contacto")
                 
-                if submit_c and nombre_c and correo_c:
+                token_contacto = token_envio("contacto", submit_c)
+                if submit_c and nombre_c and correo_c and envio_nuevo("contacto", token_contacto):
                     con = conectar()
                     cur = con.cursor()
-                    cur.execute("INSERT INTO contactos (id_empresa, nombre, correo, telefono, puesto) VALUES (?, ?, ?, ?, ?)",
-                               (id_empresa, nombre_c, correo_c, telefono_c, puesto_c))
-                    con.commit()
-                    registrar_evento(con, "contacto", cur.lastrowid, "CREAR", f"Contacto: {nombre_c}")
+                    # Alta y evento en una sola transacción: commit único o rollback conjunto
+                    with transaccion_escritura(con):
+                        cur.execute("INSERT INTO contactos (id_empresa, nombre, correo, telefono, puesto) VALUES (?, ?, ?, ?, ?)",
+                                   (id_empresa, nombre_c, correo_c, telefono_c, puesto_c))
+                        registrar_evento(con, "contacto", cur.lastrowid, "CREAR", f"Contacto: {nombre_c}")
+                    invalidar_listados()
+                    invalidar_dashboard()
+                    marcar_envio("contacto", token_contacto)
                     st.success(f"✅ Contacto '{nombre_c}' creado")
                     st.rerun()
-                    con.close()
             
             with col2:
-                con = conectar()
-                contactos = pd.read_sql("""
-                    SELECT c.id_contacto, e.nombre as empresa, c.nombre, c.correo, c.puesto
-                    FROM contactos c
-                    JOIN empresas e ON e.id_empresa = c.id_empresa
-                    ORDER BY c.fecha_alta DESC
-                    LIMIT 10
-                """, con)
-                con.close()
+                contactos = listar_contactos()
                 
                 if len(contactos) > 0:
                     st.dataframe(contactos, use_container_width=True, hide_index=True)
@@ -608,64 +1022,43 @@ elif menu == "🏗️ N1: Identidad":
         st.subheader("Generación de Prospectos")
         st.info("🔒 **REGLA R1:** Solo se generan prospectos desde empresas con contactos")
         
-        con = conectar()
-        empresas_validas = pd.read_sql("""
-            SELECT e.id_empresa, e.nombre, COUNT(c.id_contacto) as total_contactos
-            FROM empresas e
-            INNER JOIN contactos c ON c.id_empresa = e.id_empresa
-            GROUP BY e.id_empresa
-            HAVING COUNT(c.id_contacto) > 0
-            ORDER BY e.nombre
-        """, con)
-        con.close()
+        empresas_validas = opciones_empresas_con_contactos()
         
-        if len(empresas_validas) == 0:
+        if not empresas_validas:
             st.warning("⚠️ No hay empresas con contactos válidos")
         else:
             col1, col2 = st.columns([1, 1])
             
             with col1:
                 with st.form("form_prospecto"):
-                    emp_sel = st.selectbox("Empresa *", empresas_validas["nombre"].tolist())
-                    id_emp = int(empresas_validas[empresas_validas["nombre"]==emp_sel]["id_empresa"].iloc[0])
+                    emp_sel = st.selectbox("Empresa *", list(empresas_validas))
+                    id_emp = empresas_validas[emp_sel]
                     
-                    con = conectar()
-                    contactos_emp = pd.read_sql("SELECT id_contacto, nombre, puesto FROM contactos WHERE id_empresa = ?", 
-                                               con, params=(id_emp,))
-                    con.close()
+                    contactos_emp = opciones_contactos(id_emp)
                     
-                    if len(contactos_emp) > 0:
-                        cont_display = [f"{row['nombre']} ({row['puesto']})" if row['puesto'] else row['nombre'] 
-                                       for _, row in contactos_emp.iterrows()]
-                        cont_sel = st.selectbox("Contacto *", cont_display)
-                        id_cont = int(contactos_emp.iloc[cont_display.index(cont_sel)]["id_contacto"])
+                    if contactos_emp:
+                        cont_labels = {id_c: etiqueta for etiqueta, id_c in contactos_emp}
+                        id_cont = st.selectbox("Contacto *", list(cont_labels), format_func=cont_labels.get)
                         origen = st.text_input("Origen", placeholder="Campaña, Referencia, etc.")
                         submit_p = st.form_submit_button("✅ Generar Prospecto")
                         
-                        if submit_p:
+                        token_prospecto = token_envio("prospecto", submit_p)
+                        if submit_p and envio_nuevo("prospecto", token_prospecto):
                             con = conectar()
                             cur = con.cursor()
-                            cur.execute("INSERT INTO prospectos (id_empresa, id_contacto, origen, estado) VALUES (?, ?, ?, 'Activo')",
-                                       (id_emp, id_cont, origen))
-                            con.commit()
-                            registrar_evento(con, "prospecto", cur.lastrowid, "CREAR", f"Prospecto: {emp_sel}")
+                            # Alta y evento en una sola transacción: commit único o rollback conjunto
+                            with transaccion_escritura(con):
+                                cur.execute("INSERT INTO prospectos (id_empresa, id_contacto, origen, estado) VALUES (?, ?, ?, 'Activo')",
+                                           (id_emp, id_cont, origen))
+                                registrar_evento(con, "prospecto", cur.lastrowid, "CREAR", f"Prospecto: {emp_sel}")
+                            invalidar_listados()
+                            marcar_envio("prospecto", token_prospecto)
+                            invalidar_dashboard()
                             st.success(f"✅ Prospecto generado (ID: {cur.lastrowid})")
                             st.rerun()
-                            con.close()
             
             with col2:
-                con = conectar()
-                prospectos = pd.read_sql("""
-                    SELECT p.id_prospecto, e.nombre as empresa, c.nombre as contacto,
-                           p.estado, p.origen, p.fecha_creacion
-                    FROM prospectos p
-                    JOIN empresas e ON e.id_empresa = p.id_empresa
-                    JOIN contactos c ON c.id_contacto = p.id_contacto
-                    WHERE p.es_cliente = 0
-                    ORDER BY p.fecha_creacion DESC
-                    LIMIT 10
-                """, con)
-                con.close()
+                prospectos = listar_prospectos()
                 
                 if len(prospectos) > 0:
                     st.dataframe(prospectos, use_container_width=True, hide_index=True)
@@ -692,23 +1085,21 @@ elif menu == "💼 N2: Transacción":
         
         with col1:
             con = conectar()
-            prospectos_disp = pd.read_sql("""
+            prospectos_disp = con.execute("""
                 SELECT p.id_prospecto, e.nombre as empresa, c.nombre as contacto
                 FROM prospectos p
                 JOIN empresas e ON e.id_empresa = p.id_empresa
                 JOIN contactos c ON c.id_contacto = p.id_contacto
                 WHERE p.es_cliente = 0 AND p.estado = 'Activo'
                 ORDER BY p.fecha_creacion DESC
-            """, con)
-            con.close()
+            """).fetchall()
             
-            if len(prospectos_disp) == 0:
+            if not prospectos_disp:
                 st.warning("⚠️ No hay prospectos activos. Crea uno en N1: Identidad")
             else:
                 with st.form("form_oportunidad"):
-                    pros_display = [f"{row['empresa']} - {row['contacto']}" for _, row in prospectos_disp.iterrows()]
-                    pros_sel = st.selectbox("Prospecto *", pros_display)
-                    id_pros = int(prospectos_disp.iloc[pros_display.index(pros_sel)]["id_prospecto"])
+                    pros_labels = {row['id_prospecto']: f"{row['empresa']} - {row['contacto']}" for row in prospectos_disp}
+                    id_pros = st.selectbox("Prospecto *", list(pros_labels), format_func=pros_labels.get)
                     
                     nombre_op = st.text_input("Nombre de oportunidad *", placeholder="Venta de software CRM")
                     monto = st.number_input("Monto estimado *", min_value=0.0, step=1000.0)
@@ -717,33 +1108,26 @@ elif menu == "💼 N2: Transacción":
                     fecha_cierre = st.date_input("Fecha estimada cierre")
                     submit_op = st.form_submit_button("✅ Crear Oportunidad")
                     
-                    if submit_op and nombre_op and monto > 0:
+                    token_oportunidad = token_envio("oportunidad", submit_op)
+                    if submit_op and nombre_op and monto > 0 and envio_nuevo("oportunidad", token_oportunidad):
                         con = conectar()
                         cur = con.cursor()
-                        cur.execute("""
-                            INSERT INTO oportunidades 
-                            (id_prospecto, nombre, etapa, probabilidad, monto_estimado, fecha_estimada_cierre)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, (id_pros, nombre_op, etapa, probabilidad, monto, fecha_cierre.isoformat()))
-                        con.commit()
-                        registrar_evento(con, "oportunidad", cur.lastrowid, "CREAR", f"Oportunidad: {nombre_op}")
+                        # Alta y evento en una sola transacción: commit único o rollback conjunto
+                        with transaccion_escritura(con):
+                            cur.execute("""
+                                INSERT INTO oportunidades 
+                                (id_prospecto, nombre, etapa, probabilidad, monto_estimado, fecha_estimada_cierre)
+                                VALUES (?, ?, ?, ?, ?, ?)
+                            """, (id_pros, nombre_op, etapa, probabilidad, monto, fecha_cierre.isoformat()))
+                            registrar_evento(con, "oportunidad", cur.lastrowid, "CREAR", f"Oportunidad: {nombre_op}")
+                        invalidar_listados()
+                        marcar_envio("oportunidad", token_oportunidad)
+                        invalidar_dashboard()
                         st.success(f"✅ Oportunidad '{nombre_op}' creada")
                         st.rerun()
-                        con.close()
         
         with col2:
-            con = conectar()
-            oportunidades = pd.read_sql("""
-                SELECT o.id_oportunidad, o.nombre, o.etapa, o.probabilidad,
-                       ROUND(o.monto_estimado, 2) as monto, o.oc_recibida,
-                       e.nombre as empresa
-                FROM oportunidades o
-                JOIN prospectos p ON p.id_prospecto = o.id_prospecto
-                JOIN empresas e ON e.id_empresa = p.id_empresa
-                ORDER BY o.fecha_creacion DESC
-                LIMIT 10
-            """, con)
-            con.close()
+            oportunidades = listar_oportunidades()
             
             if len(oportunidades) > 0:
                 st.dataframe(oportunidades, use_container_width=True, hide_index=True)
@@ -759,32 +1143,31 @@ elif menu == "💼 N2: Transacción":
                 with col_a1:
                     if st.button("🎉 Marcar como Ganada (REGLA R3)", use_container_width=True):
                         con = conectar()
-                        cur = con.cursor()
-                        # Actualizar oportunidad
-                        cur.execute("UPDATE oportunidades SET etapa='Ganada', probabilidad=100 WHERE id_oportunidad=?", 
-                                   (opor_sel_id,))
-                        # REGLA R3: Convertir prospecto a cliente
-                        cur.execute("""
-                            UPDATE prospectos SET es_cliente=1, fecha_conversion_cliente=? 
-                            WHERE id_prospecto = (SELECT id_prospecto FROM oportunidades WHERE id_oportunidad=?)
-                        """, (date.today().isoformat(), opor_sel_id))
-                        con.commit()
-                        registrar_evento(con, "oportunidad", opor_sel_id, "GANAR", "Oportunidad ganada → Cliente convertido")
+                        with transaccion_escritura(con):
+                            cur = con.cursor()
+                            # Actualizar oportunidad
+                            cur.execute("UPDATE oportunidades SET etapa='Ganada', probabilidad=100 WHERE id_oportunidad=?", 
+                                       (opor_sel_id,))
+                            # REGLA R3: Convertir prospecto a cliente
+                            cur.execute("""
+                                UPDATE prospectos SET es_cliente=1, fecha_conversion_cliente=? 
+                                WHERE id_prospecto = (SELECT id_prospecto FROM oportunidades WHERE id_oportunidad=?)
+                            """, (date.today().isoformat(), opor_sel_id))
+                            registrar_evento(con, "oportunidad", opor_sel_id, "GANAR", "Oportunidad ganada → Cliente convertido")
+                        invalidar_listados()
+                        invalidar_dashboard()
                         st.success("✅ Oportunidad ganada y prospecto convertido a cliente")
                         st.rerun()
-                        con.close()
                 
                 with col_a2:
                     if st.button("📋 Marcar OC Recibida (REGLA R4)", use_container_width=True):
                         try:
                             con = conectar()
-                            cur = con.cursor()
-                            # Actualizar estado OC
-                            cur.execute("UPDATE oportunidades SET oc_recibida=1 WHERE id_oportunidad=?", (opor_sel_id,))
-                            con.commit()
-                            
-                            # Registrar evento en historial
-                            registrar_evento(con, "oportunidad", opor_sel_id, "OC_RECIBIDA", "OC marcada como recibida")
+                            # UPDATE y evento en una sola transacción: commit único o rollback conjunto
+                            with transaccion_escritura(con):
+                                con.execute("UPDATE oportunidades SET oc_recibida=1 WHERE id_oportunidad=?", (opor_sel_id,))
+                                registrar_evento(con, "oportunidad", opor_sel_id, "OC_RECIBIDA", "OC marcada como recibida")
+                            invalidar_listados()
                             
                             st.success("✅ OC recibida marcada y evento registrado en historial")
                             st.rerun()
@@ -792,9 +1175,6 @@ elif menu == "💼 N2: Transacción":
                             st.error(f"❌ Error al marcar OC: {str(e)}")
                             import traceback
                             traceback.print_exc(file=sys.stderr)
-                        finally:
-                            if 'con' in locals():
-                                con.close()
             else:
                 st.info("No hay oportunidades registradas")
     
@@ -807,22 +1187,20 @@ elif menu == "💼 N2: Transacción":
         
         with col1:
             con = conectar()
-            opor_para_cot = pd.read_sql("""
+            opor_para_cot = con.execute("""
                 SELECT o.id_oportunidad, o.nombre, o.etapa, ROUND(o.monto_estimado, 2) as monto
                 FROM oportunidades o
                 WHERE o.etapa NOT IN ('Perdida')
                 ORDER BY o.fecha_creacion DESC
-            """, con)
-            con.close()
+            """).fetchall()
             
-            if len(opor_para_cot) == 0:
+            if not opor_para_cot:
                 st.warning("⚠️ No hay oportunidades disponibles")
             else:
                 with st.form("form_cotizacion"):
-                    opor_display = [f"#{row['id_oportunidad']} - {row['nombre']} (${row['monto']})" 
-                                   for _, row in opor_para_cot.iterrows()]
-                    opor_sel = st.selectbox("Oportunidad *", opor_display)
-                    id_opor = int(opor_para_cot.iloc[opor_display.index(opor_sel)]["id_oportunidad"])
+                    opor_labels = {row['id_oportunidad']: f"#{row['id_oportunidad']} - {row['nombre']} (${row['monto']})" 
+                                   for row in opor_para_cot}
+                    id_opor = st.selectbox("Oportunidad *", list(opor_labels), format_func=opor_labels.get)
                     
                     modo = st.selectbox("Modo *", ["minimo", "generico", "externo"])
                     monto_cot = st.number_input("Monto total *", min_value=0.0, step=100.0)
@@ -830,42 +1208,36 @@ elif menu == "💼 N2: Transacción":
                     notas = st.text_area("Notas", placeholder="Descripción de la cotización")
                     submit_cot = st.form_submit_button("✅ Crear Cotización")
                     
-                    if submit_cot and monto_cot > 0:
+                    token_cotizacion = token_envio("cotizacion", submit_cot)
+                    if submit_cot and monto_cot > 0 and envio_nuevo("cotizacion", token_cotizacion):
                         import json
-                        # Generar hash de integridad
+                        # Generar hash de integridad (antes de tocar la conexión; JSON compacto).
+                        # Sin los espacios de json.dumps por defecto: no es comparable con los
+                        # hash_integridad guardados antes de este cambio
                         data = {"id_oportunidad": id_opor, "modo": modo, "monto": monto_cot, "moneda": moneda}
-                        hash_int = hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+                        payload = json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+                        hash_int = hashlib.sha256(payload).hexdigest()
                         
                         con = conectar()
-                        cur = con.cursor()
-                        cur.execute("""
-                            INSERT INTO cotizaciones 
-                            (id_oportunidad, modo, fuente, monto_total, moneda, estado, hash_integridad, notas)
-                            VALUES (?, ?, 'manual', ?, ?, 'Borrador', ?, ?)
-                        """, (id_opor, modo, monto_cot, moneda, hash_int, notas))
-                        con.commit()
-                        cot_id = cur.lastrowid
-                        # Registrar hash en tabla de trazabilidad
-                        cur.execute("INSERT INTO hash_registros (tabla_origen, id_registro, hash_sha256) VALUES ('cotizaciones', ?, ?)",
-                                   (cot_id, hash_int))
-                        con.commit()
-                        registrar_evento(con, "cotizacion", cot_id, "CREAR", f"Cotización modo {modo} - ${monto_cot} {moneda}")
+                        # Cotización + hash forense + evento: un solo commit, o rollback conjunto
+                        with transaccion_escritura(con):
+                            cur = con.cursor()
+                            cur.execute("""
+                                INSERT INTO cotizaciones 
+                                (id_oportunidad, modo, fuente, monto_total, moneda, estado, hash_integridad, notas)
+                                VALUES (?, ?, 'manual', ?, ?, 'Borrador', ?, ?)
+                            """, (id_opor, modo, monto_cot, moneda, hash_int, notas))
+                            cot_id = cur.lastrowid
+                            cur.execute("INSERT INTO hash_registros (tabla_origen, id_registro, hash_sha256) VALUES ('cotizaciones', ?, ?)",
+                                       (cot_id, hash_int))
+                            registrar_evento(con, "cotizacion", cot_id, "CREAR", f"Cotización modo {modo} - ${monto_cot} {moneda}")
+                        invalidar_listados()
+                        marcar_envio("cotizacion", token_cotizacion)
                         st.success(f"✅ Cotización creada con hash: {hash_int[:16]}...")
                         st.rerun()
-                        con.close()
         
         with col2:
-            con = conectar()
-            cotizaciones = pd.read_sql("""
-                SELECT c.id_cotizacion, o.nombre as oportunidad, c.modo, 
-                       ROUND(c.monto_total, 2) as monto, c.moneda, c.estado, c.version,
-                       substr(c.hash_integridad, 1, 16) as hash
-                FROM cotizaciones c
-                JOIN oportunidades o ON o.id_oportunidad = c.id_oportunidad
-                ORDER BY c.fecha_creacion DESC
-                LIMIT 10
-            """, con)
-            con.close()
+            cotizaciones = listar_cotizaciones()
             
             if len(cotizaciones) > 0:
                 st.dataframe(cotizaciones, use_container_width=True, hide_index=True)
@@ -893,7 +1265,8 @@ elif menu == "💰 N3: Facturación":
     tab1, tab2 = st.tabs(["🧾 Órdenes de Compra", "📄 Facturas"])
     
     # TAB: Órdenes de Compra
-    with tab1:
+    @st.fragment
+    def render_tab_ordenes_compra():
         st.subheader("Gestión de Órdenes de Compra")
         st.info("🔒 **REGLA R4:** OC es requisito para facturar")
         
@@ -901,26 +1274,32 @@ elif menu == "💰 N3: Facturación":
         
         with col1:
             con = conectar()
-            opor_ganadas = pd.read_sql("""
-                SELECT o.id_oportunidad, o.nombre, ROUND(o.monto_estimado, 2) as monto,
-                       e.nombre as empresa
-                FROM oportunidades o
-                JOIN prospectos p ON p.id_prospecto = o.id_prospecto
-                JOIN empresas e ON e.id_empresa = p.id_empresa
+            # Sondeo barato (sin JOINs) antes de cargar el selector completo
+            hay_pendientes = con.execute("""
+                SELECT 1 FROM oportunidades o
                 WHERE o.etapa = 'Ganada' AND o.oc_recibida = 1
-                AND o.id_oportunidad NOT IN (SELECT id_oportunidad FROM ordenes_compra)
-                ORDER BY o.fecha_creacion DESC
-            """, con)
-            con.close()
+                AND NOT EXISTS (SELECT 1 FROM ordenes_compra x WHERE x.id_oportunidad = o.id_oportunidad)
+                LIMIT 1
+            """).fetchone()
             
-            if len(opor_ganadas) == 0:
+            if not hay_pendientes:
                 st.warning("⚠️ No hay oportunidades ganadas con OC pendientes de registrar")
             else:
+                opor_ganadas = con.execute("""
+                    SELECT o.id_oportunidad, o.nombre, ROUND(o.monto_estimado, 2) as monto,
+                           e.nombre as empresa
+                    FROM oportunidades o
+                    JOIN prospectos p ON p.id_prospecto = o.id_prospecto
+                    JOIN empresas e ON e.id_empresa = p.id_empresa
+                    WHERE o.etapa = 'Ganada' AND o.oc_recibida = 1
+                    AND NOT EXISTS (SELECT 1 FROM ordenes_compra x WHERE x.id_oportunidad = o.id_oportunidad)
+                    ORDER BY o.fecha_creacion DESC
+                """).fetchall()
+                
                 with st.form("form_oc"):
-                    opor_display = [f"#{row['id_oportunidad']} - {row['nombre']} (${row['monto']}) - {row['empresa']}" 
-                                   for _, row in opor_ganadas.iterrows()]
-                    opor_sel = st.selectbox("Oportunidad *", opor_display)
-                    id_opor = int(opor_ganadas.iloc[opor_display.index(opor_sel)]["id_oportunidad"])
+                    opor_labels = {row['id_oportunidad']: f"#{row['id_oportunidad']} - {row['nombre']} (${row['monto']}) - {row['empresa']}" 
+                                   for row in opor_ganadas}
+                    id_opor = st.selectbox("Oportunidad *", list(opor_labels), format_func=opor_labels.get)
                     
                     numero_oc = st.text_input("Número de OC *", placeholder="OC-2025-001")
                     fecha_oc = st.date_input("Fecha OC *")
@@ -930,28 +1309,27 @@ elif menu == "💰 N3: Facturación":
                     
                     if submit_oc and numero_oc and monto_oc > 0:
                         con = conectar()
-                        cur = con.cursor()
-                        cur.execute("""
-                            INSERT INTO ordenes_compra (id_oportunidad, numero_oc, fecha_oc, monto_oc, moneda)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, (id_opor, numero_oc, fecha_oc.isoformat(), monto_oc, moneda_oc))
-                        con.commit()
-                        registrar_evento(con, "orden_compra", cur.lastrowid, "CREAR", f"OC {numero_oc} - ${monto_oc} {moneda_oc}")
+                        # OC y evento en una sola transacción: commit único o rollback conjunto
+                        with transaccion_escritura(con):
+                            cur = con.cursor()
+                            cur.execute("""
+                                INSERT INTO ordenes_compra (id_oportunidad, numero_oc, fecha_oc, monto_oc, moneda)
+                                VALUES (?, ?, ?, ?, ?)
+                            """, (id_opor, numero_oc, fecha_oc.isoformat(), monto_oc, moneda_oc))
+                            registrar_evento(con, "orden_compra", cur.lastrowid, "CREAR", f"OC {numero_oc} - ${monto_oc} {moneda_oc}")
                         st.success(f"✅ OC '{numero_oc}' registrada")
                         st.rerun()
-                        con.close()
         
         with col2:
             con = conectar()
-            ocs = pd.read_sql("""
+            ocs = filas_dict(con, """
                 SELECT oc.id_oc, oc.numero_oc, oc.fecha_oc, ROUND(oc.monto_oc, 2) as monto,
                        oc.moneda, o.nombre as oportunidad
                 FROM ordenes_compra oc
                 JOIN oportunidades o ON o.id_oportunidad = oc.id_oportunidad
                 ORDER BY oc.fecha_oc DESC
                 LIMIT 10
-            """, con)
-            con.close()
+            """)
             
             if len(ocs) > 0:
                 st.dataframe(ocs, use_container_width=True, hide_index=True)
@@ -959,7 +1337,8 @@ elif menu == "💰 N3: Facturación":
                 st.info("No hay OCs registradas")
     
     # TAB: Facturas
-    with tab2:
+    @st.fragment
+    def render_tab_facturas():
         st.subheader("Gestión de Facturas CFDI")
         
         # Validar configuración CFDI antes de permitir facturar
@@ -988,17 +1367,22 @@ elif menu == "💰 N3: Facturación":
         
         with col1:
             con = conectar()
-            ocs_sin_factura = pd.read_sql("""
-                SELECT oc.id_oc, oc.numero_oc, ROUND(oc.monto_oc, 2) as monto, oc.moneda
-                FROM ordenes_compra oc
-                WHERE oc.id_oc NOT IN (SELECT id_oc FROM facturas)
-                ORDER BY oc.fecha_oc DESC
-            """, con)
-            con.close()
+            hay_ocs_pendientes = con.execute("""
+                SELECT 1 FROM ordenes_compra oc
+                WHERE NOT EXISTS (SELECT 1 FROM facturas f WHERE f.id_oc = oc.id_oc)
+                LIMIT 1
+            """).fetchone()
             
-            if len(ocs_sin_factura) == 0:
+            if not hay_ocs_pendientes:
                 st.warning("⚠️ No hay OCs pendientes de facturar")
             else:
+                ocs_sin_factura = con.execute("""
+                    SELECT oc.id_oc, oc.numero_oc, ROUND(oc.monto_oc, 2) as monto, oc.moneda
+                    FROM ordenes_compra oc
+                    WHERE NOT EXISTS (SELECT 1 FROM facturas f WHERE f.id_oc = oc.id_oc)
+                    ORDER BY oc.fecha_oc DESC
+                """).fetchall()
+                
                 # Mostrar opción de timbrado automático si CFDI está configurado
                 if CFDI_DISPONIBLE:
                     valido_cfdi, _ = validar_configuracion_cfdi()
@@ -1011,10 +1395,9 @@ elif menu == "💰 N3: Facturación":
                     st.markdown("### 📝 Registro Manual de Factura")
                     st.caption("Ingresa los datos de la factura ya timbrada en tu PAC")
                     
-                    oc_display = [f"OC #{row['id_oc']} - {row['numero_oc']} (${row['monto']} {row['moneda']})" 
-                                 for _, row in ocs_sin_factura.iterrows()]
-                    oc_sel = st.selectbox("Orden de Compra *", oc_display)
-                    id_oc = int(ocs_sin_factura.iloc[oc_display.index(oc_sel)]["id_oc"])
+                    oc_labels = {row['id_oc']: f"OC #{row['id_oc']} - {row['numero_oc']} (${row['monto']} {row['moneda']})" 
+                                 for row in ocs_sin_factura}
+                    id_oc = st.selectbox("Orden de Compra *", list(oc_labels), format_func=oc_labels.get)
                     
                     uuid = st.text_input("UUID CFDI *", placeholder="A1B2C3D4-...")
                     serie = st.text_input("Serie", placeholder="A")
@@ -1025,32 +1408,34 @@ elif menu == "💰 N3: Facturación":
                     submit_fact = st.form_submit_button("✅ Registrar Factura")
                     
                     if submit_fact and uuid and monto_fact > 0:
-                        import json
-                        # Hash forense de la factura
-                        data_fact = {"uuid": uuid, "serie": serie, "folio": folio, 
-                                    "fecha": fecha_emision.isoformat(), "monto": monto_fact}
-                        hash_fact = hashlib.sha256(json.dumps(data_fact, sort_keys=True).encode()).hexdigest()
+                        # Hash forense de la factura: campos en orden fijo separados por "|"
+                        # alimentados al hasher, sin serializar un dict a JSON. Este formato no es
+                        # comparable con los hashes guardados antes en hash_registros (JSON con
+                        # sort_keys): una verificación debe recalcular con el formato de su fecha
+                        h_fact = hashlib.sha256()
+                        for campo in (uuid, serie, folio, fecha_emision.isoformat(), f"{monto_fact:.2f}"):
+                            h_fact.update(campo.encode())
+                            h_fact.update(b"|")
+                        hash_fact = h_fact.hexdigest()
                         
                         con = conectar()
-                        cur = con.cursor()
-                        cur.execute("""
-                            INSERT INTO facturas (id_oc, uuid, serie, folio, fecha_emision, monto_total, moneda)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        """, (id_oc, uuid, serie, folio, fecha_emision.isoformat(), monto_fact, moneda_fact))
-                        con.commit()
-                        fact_id = cur.lastrowid
-                        # Registrar hash forense
-                        cur.execute("INSERT INTO hash_registros (tabla_origen, id_registro, hash_sha256) VALUES ('facturas', ?, ?)",
-                                   (fact_id, hash_fact))
-                        con.commit()
-                        registrar_evento(con, "factura", fact_id, "CREAR", f"Factura {serie}-{folio} UUID:{uuid[:16]}...")
+                        # Factura + hash forense + evento: un solo commit, o rollback conjunto
+                        with transaccion_escritura(con):
+                            cur = con.cursor()
+                            cur.execute("""
+                                INSERT INTO facturas (id_oc, uuid, serie, folio, fecha_emision, monto_total, moneda)
+                                VALUES (?, ?, ?, ?, ?, ?, ?)
+                            """, (id_oc, uuid, serie, folio, fecha_emision.isoformat(), monto_fact, moneda_fact))
+                            fact_id = cur.lastrowid
+                            cur.execute("INSERT INTO hash_registros (tabla_origen, id_registro, hash_sha256) VALUES ('facturas', ?, ?)",
+                                       (fact_id, hash_fact))
+                            registrar_evento(con, "factura", fact_id, "CREAR", f"Factura {serie}-{folio} UUID:{uuid[:16]}...")
                         st.success(f"✅ Factura creada con hash: {hash_fact[:16]}...")
                         st.rerun()
-                        con.close()
         
         with col2:
             con = conectar()
-            facturas = pd.read_sql("""
+            facturas = filas_dict(con, """
                 SELECT f.id_factura, f.uuid, f.serie, f.folio, f.fecha_emision,
                        ROUND(f.monto_total, 2) as monto, f.moneda,
                        oc.numero_oc
@@ -1058,13 +1443,18 @@ elif menu == "💰 N3: Facturación":
                 JOIN ordenes_compra oc ON oc.id_oc = f.id_oc
                 ORDER BY f.fecha_emision DESC
                 LIMIT 10
-            """, con)
-            con.close()
+            """)
             
             if len(facturas) > 0:
                 st.dataframe(facturas, use_container_width=True, hide_index=True)
             else:
                 st.info("No hay facturas registradas")
+    
+    with tab1:
+        render_tab_ordenes_compra()
+    
+    with tab2:
+        render_tab_facturas()
 
 
 # ================================================================
@@ -1078,7 +1468,8 @@ elif menu == "🪶 N4: Trazabilidad":
     tab1, tab2 = st.tabs(["📋 Historial General", "🔐 Verificación de Hashes"])
     
     # TAB: Historial
-    with tab1:
+    @st.fragment
+    def render_tab_historial():
         st.subheader("Historial de Eventos")
         
         con = conectar()
@@ -1098,38 +1489,21 @@ elif menu == "🪶 N4: Trazabilidad":
         with col_f3:
             limite = st.number_input("Límite de registros", min_value=10, max_value=100, value=50, step=10)
         
-        # Construir query con filtros
-        query = "SELECT * FROM historial_general WHERE 1=1"
-        params = []
-        
-        if filtro_entidad != "Todas":
-            query += " AND entidad = ?"
-            params.append(filtro_entidad)
+        params = {
+            "ent": None if filtro_entidad == "Todas" else filtro_entidad,
+            "acc": None if filtro_accion == "Todas" else filtro_accion,
+            "lim": int(limite),
+        }
+        historial = filas_dict(con, _SQL_HISTORIAL, params)
         
-        if filtro_accion != "Todas":
-            query += " AND accion = ?"
-            params.append(filtro_accion)
-        
-        query += " ORDER BY timestamp DESC LIMIT ?"
-        params.append(limite)
-        
-        historial = pd.read_sql(query, con, params=params)
-        con.close()
-        
-        if len(historial) > 0:
-            # Mostrar con hash truncado
-            historial['hash_corto'] = historial['hash_evento'].str[:16]
-            st.dataframe(
-                historial[['id_evento', 'entidad', 'id_entidad', 'accion', 'valor_nuevo', 
-                          'usuario', 'timestamp', 'hash_corto']],
-                use_container_width=True,
-                hide_index=True
-            )
+        if historial:
+            st.dataframe(historial, use_container_width=True, hide_index=True)
         else:
             st.info("No hay eventos que cumplan los filtros")
     
     # TAB: Verificación de hashes
-    with tab2:
+    @st.fragment
+    def render_tab_hashes():
         st.subheader("Verificación de Integridad Forense")
         
         col1, col2 = st.columns(2)
@@ -1137,15 +1511,14 @@ elif menu == "🪶 N4: Trazabilidad":
         with col1:
             st.markdown("**Hashes de Cotizaciones:**")
             con = conectar()
-            hashes_cot = pd.read_sql("""
+            hashes_cot = filas_dict(con, """
                 SELECT h.id_hash, h.id_registro, substr(h.hash_sha256, 1, 20) as hash,
                        h.timestamp
                 FROM hash_registros h
                 WHERE h.tabla_origen = 'cotizaciones'
                 ORDER BY h.timestamp DESC
                 LIMIT 10
-            """, con)
-            con.close()
+            """)
             
             if len(hashes_cot) > 0:
                 st.dataframe(hashes_cot, use_container_width=True, hide_index=True)
@@ -1155,15 +1528,14 @@ elif menu == "🪶 N4: Trazabilidad":
         with col2:
             st.markdown("**Hashes de Facturas:**")
             con = conectar()
-            hashes_fact = pd.read_sql("""
+            hashes_fact = filas_dict(con, """
                 SELECT h.id_hash, h.id_registro, substr(h.hash_sha256, 1, 20) as hash,
                        h.timestamp
                 FROM hash_registros h
                 WHERE h.tabla_origen = 'facturas'
                 ORDER BY h.timestamp DESC
                 LIMIT 10
-            """, con)
-            con.close()
+            """)
             
             if len(hashes_fact) > 0:
                 st.dataframe(hashes_fact, use_container_width=True, hide_index=True)
@@ -1176,22 +1548,29 @@ elif menu == "🪶 N4: Trazabilidad":
         st.subheader("📊 Estadísticas del Sistema")
         
         con = conectar()
+        total_eventos, total_hashes, usuarios_activos = con.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM historial_general),
+                (SELECT COUNT(*) FROM hash_registros),
+                (SELECT COUNT(DISTINCT usuario) FROM historial_general)
+        """).fetchone()
         
         col_s1, col_s2, col_s3 = st.columns(3)
         
         with col_s1:
-            total_eventos = pd.read_sql("SELECT COUNT(*) as total FROM historial_general", con).iloc[0]["total"]
             st.metric("Total de Eventos", total_eventos)
         
         with col_s2:
-            total_hashes = pd.read_sql("SELECT COUNT(*) as total FROM hash_registros", con).iloc[0]["total"]
             st.metric("Hashes Forenses", total_hashes)
         
         with col_s3:
-            usuarios_activos = pd.read_sql("SELECT COUNT(DISTINCT usuario) as total FROM historial_general", con).iloc[0]["total"]
             st.metric("Usuarios Registrados", usuarios_activos)
-        
-        con.close()
+    
+    with tab1:
+        render_tab_historial()
+    
+    with tab2:
+        render_tab_hashes()
 
 
 # ================================================================
@@ -1201,27 +1580,8 @@ elif menu == "🪶 N4: Trazabilidad":
 elif menu == "📊 Pipeline Visual":
     st.markdown('<div class="main-header">📊 Pipeline Visual Completo</div>', unsafe_allow_html=True)
     
-    con = conectar()
-    
     # Flujo completo desde empresas hasta facturas
-    flujo_completo = pd.read_sql("""
-        SELECT 
-            e.id_empresa,
-            e.nombre as empresa,
-            COUNT(DISTINCT c.id_contacto) as contactos,
-            COUNT(DISTINCT p.id_prospecto) as prospectos,
-            COUNT(DISTINCT CASE WHEN p.es_cliente = 0 THEN p.id_prospecto END) as prospectos_activos,
-            COUNT(DISTINCT CASE WHEN p.es_cliente = 1 THEN p.id_prospecto END) as clientes,
-            COUNT(DISTINCT o.id_oportunidad) as oportunidades,
-            COUNT(DISTINCT CASE WHEN o.etapa = 'Ganada' THEN o.id_oportunidad END) as ganadas,
-            ROUND(COALESCE(SUM(CASE WHEN o.etapa = 'Ganada' THEN o.monto_estimado END), 0), 2) as monto_ganado
-        FROM empresas e
-        LEFT JOIN contactos c ON c.id_empresa = e.id_empresa
-        LEFT JOIN prospectos p ON p.id_empresa = e.id_empresa
-        LEFT JOIN oportunidades o ON o.id_prospecto = p.id_prospecto
-        GROUP BY e.id_empresa
-        ORDER BY monto_ganado DESC, oportunidades DESC
-    """, con)
+    flujo_completo = cargar_flujo_completo()
     
     if len(flujo_completo) > 0:
         st.dataframe(
@@ -1249,10 +1609,7 @@ elif menu == "📊 Pipeline Visual":
     
     col1, col2, col3, col4 = st.columns(4)
     
-    total_emp = pd.read_sql("SELECT COUNT(*) as total FROM empresas", con).iloc[0]["total"]
-    total_pros = pd.read_sql("SELECT COUNT(*) as total FROM prospectos WHERE es_cliente=0", con).iloc[0]["total"]
-    total_opor = pd.read_sql("SELECT COUNT(*) as total FROM oportunidades WHERE etapa NOT IN ('Perdida')", con).iloc[0]["total"]
-    total_cli = pd.read_sql("SELECT COUNT(*) as total FROM prospectos WHERE es_cliente=1", con).iloc[0]["total"]
+    total_emp, total_pros, total_opor, total_cli = cargar_embudo_conversion()
     
     with col1:
         st.metric("🏢 Empresas", total_emp)
@@ -1272,7 +1629,6 @@ elif menu == "📊 Pipeline Visual":
         if total_opor > 0:
             st.caption(f"Conversión: {(total_cli/max(total_opor,1)*100):.1f}%")
     
-    con.close()
 
 
 # ================================================================
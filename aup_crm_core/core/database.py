@@ -1,9 +1,71 @@
 import sqlite3
 import os
+import re
+import atexit
+import queue
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 
+from .ui_utils import parse_atributos
+
 DB_PATH = Path(__file__).resolve().parent.parent / "data" / "aup_crm.sqlite"
 
+# Ajustes aplicados a cada conexión: WAL para lecturas concurrentes con
+# escrituras, menos fsyncs (synchronous=NORMAL) y caché de 64 MiB en memoria
+PRAGMAS_CONEXION = """
+    PRAGMA journal_mode = WAL;
+    PRAGMA synchronous = NORMAL;
+    PRAGMA cache_size = -65536;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA busy_timeout = 5000;
+    PRAGMA foreign_keys = ON;
+"""
+
+# Ajustes de las conexiones de solo lectura (el modo WAL ya lo fija la
+# conexión compartida; foreign_keys no aplica a lecturas)
+PRAGMAS_LECTURA = """
+    PRAGMA cache_size = -65536;
+    PRAGMA temp_store = MEMORY;
+    PRAGMA mmap_size = 268435456;
+    PRAGMA busy_timeout = 5000;
+"""
+
+# Conexiones de solo lectura del pool (ver conexion_lectura)
+TAMANO_POOL_LECTURA = max(4, os.cpu_count() or 1)
+
+# Índices de los accesos frecuentes de los módulos (listados por tipo, filtros
+# por activo, listado de empresas por nombre y recorridos del grafo por
+# origen/destino, login por correo, duplicados de prospectos por nombre
+# normalizado en limpiar_duplicados.py). IF NOT EXISTS: se aplican también
+# sobre bases ya creadas, una vez por proceso, con la primera conexión que se abre
+INDICES_AUP = """
+    CREATE INDEX IF NOT EXISTS idx_agentes_tipo_fecha ON aup_agentes(tipo, fecha_creacion);
+    CREATE INDEX IF NOT EXISTS idx_agentes_tipo_activo ON aup_agentes(tipo, activo);
+    CREATE INDEX IF NOT EXISTS idx_agentes_tipo_nombre ON aup_agentes(tipo, nombre);
+    CREATE INDEX IF NOT EXISTS idx_relaciones_origen_tipo ON aup_relaciones(agente_origen, tipo_relacion);
+    CREATE INDEX IF NOT EXISTS idx_relaciones_destino_tipo ON aup_relaciones(agente_destino, tipo_relacion);
+    CREATE INDEX IF NOT EXISTS idx_eventos_agente ON aup_eventos(agente_id);
+    CREATE INDEX IF NOT EXISTS idx_agentes_correo ON aup_agentes(correo) WHERE tipo = 'usuario';
+    CREATE INDEX IF NOT EXISTS idx_agentes_nombre_norm ON aup_agentes(LOWER(TRIM(nombre)), nombre) WHERE tipo = 'prospecto';
+"""
+
+# Conexión de larga vida compartida por el proceso (ver get_shared_connection)
+_shared_conn = None
+_shared_lock = threading.Lock()
+
+# Pool de conexiones de solo lectura, creado con la primera lectura
+_pool_lectura = None
+
+# Indica si migraciones e INDICES_AUP ya se aplicaron en este proceso; el lock
+# evita que dos sesiones que conectan a la vez migren en paralelo
+_esquema_preparado = False
+_esquema_lock = threading.Lock()
+
+# Serializa las escrituras sobre la conexión compartida entre hilos de Streamlit
+write_lock = threading.Lock()
+
 def get_connection():
     """Retorna conexión activa a la base de datos."""
     try:
@@ -11,11 +73,147 @@ def get_connection():
             init_db()
         conn = sqlite3.connect(DB_PATH)
         conn.row_factory = sqlite3.Row
+        conn.executescript(PRAGMAS_CONEXION)
+        _preparar_esquema(conn)
         return conn
     except Exception as e:
         print(f"❌ Error al conectar con la base de datos: {e}")
         return None
 
+def _preparar_esquema(conn):
+    """Migra bases existentes, crea INDICES_AUP y genera estadísticas la primera
+    vez que se conecta el proceso."""
+    global _esquema_preparado
+    if _esquema_preparado:
+        return
+    with _esquema_lock:
+        if _esquema_preparado:
+            return
+        _migrar_correo(conn)
+        conn.executescript(INDICES_AUP)
+        # Sin sqlite_stat1 el planificador no conoce la selectividad de los
+        # índices; se analiza una sola vez (luego lo mantiene PRAGMA optimize)
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone():
+            conn.execute("ANALYZE")
+        _esquema_preparado = True
+
+def _migrar_correo(conn):
+    """Agrega la columna correo (login por igualdad, sin LIKE sobre atributos)
+    y la rellena desde atributos para los usuarios que aún no la tienen."""
+    columnas = {fila[1] for fila in conn.execute("PRAGMA table_info(aup_agentes)")}
+    with conn:
+        if "correo" not in columnas:
+            try:
+                conn.execute("ALTER TABLE aup_agentes ADD COLUMN correo TEXT")
+            except sqlite3.OperationalError as e:
+                # Otro proceso la agregó entre el PRAGMA y el ALTER
+                if "duplicate column" not in str(e):
+                    raise
+        pendientes = conn.execute(
+            "SELECT id, atributos FROM aup_agentes WHERE tipo='usuario' AND correo IS NULL"
+        ).fetchall()
+        conn.executemany(
+            "UPDATE aup_agentes SET correo=? WHERE id=?",
+            [(parse_atributos(atributos).get("correo"), id_agente) for id_agente, atributos in pendientes]
+        )
+
+def get_shared_connection():
+    """Retorna la conexión compartida del proceso (se abre una sola vez).
+    No debe cerrarse; las escrituras deben hacerse bajo write_lock."""
+    global _shared_conn
+    if _shared_conn is None:
+        with _shared_lock:
+            if _shared_conn is None:
+                if not DB_PATH.exists():
+                    init_db()
+                conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+                conn.row_factory = sqlite3.Row
+                conn.executescript(PRAGMAS_CONEXION)
+                _preparar_esquema(conn)
+                atexit.register(_cerrar_shared_connection)
+                _shared_conn = conn
+    return _shared_conn
+
+def _obtener_pool_lectura():
+    """Pool de conexiones de solo lectura (mode=ro), creado una sola vez por proceso."""
+    global _pool_lectura
+    if _pool_lectura is None:
+        get_shared_connection()  # crea la base, fija WAL y prepara el esquema
+        with _shared_lock:
+            if _pool_lectura is None:
+                pool = queue.Queue()
+                for _ in range(TAMANO_POOL_LECTURA):
+                    conn = sqlite3.connect(f"{DB_PATH.as_uri()}?mode=ro", uri=True,
+                                           check_same_thread=False)
+                    conn.row_factory = sqlite3.Row
+                    conn.executescript(PRAGMAS_LECTURA)
+                    pool.put(conn)
+                _pool_lectura = pool
+    return _pool_lectura
+
+@contextmanager
+def conexion_lectura():
+    """Toma prestada una conexión de solo lectura del pool y la devuelve al salir.
+    Cada hilo lee con su propia conexión: nunca ve escrituras sin confirmar de
+    la conexión compartida ni corre a la vez que su commit; con WAL las
+    lecturas no esperan al escritor."""
+    pool = _obtener_pool_lectura()
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
+
+def _cerrar_shared_connection():
+    """Al salir del proceso: actualiza estadísticas del planificador
+    (PRAGMA optimize) para que use los índices, y cierra la conexión."""
+    global _shared_conn, _pool_lectura
+    if _pool_lectura is not None:
+        while not _pool_lectura.empty():
+            _pool_lectura.get_nowait().close()
+        _pool_lectura = None
+    if _shared_conn is not None:
+        try:
+            with write_lock:
+                _shared_conn.execute("PRAGMA optimize")
+                _shared_conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ No se pudo optimizar la base al cerrar: {e}")
+        _shared_conn = None
+
+def sql_atributo(columna, clave):
+    """Expresión SQL que extrae el valor de `clave` de un texto "clave=valor;..."
+    dentro de SQLite (permite filtrar, agregar y ordenar sin traer las filas a
+    Python). NULL si la clave falta o está vacía.
+
+    Coincide con parse_atributos(texto).get(clave) para el formato que escriben
+    los módulos (claves sin espacios y sin repetir). Difiere en dos casos:
+    - clave repetida: toma la primera aparición; parse_atributos, la última
+      con valor no vacío
+    - espacios alrededor de la clave (" estado=..."): no la encuentra;
+      parse_atributos recorta la clave
+    columna y clave se interpolan en el SQL: sólo identificadores fijos."""
+    if not re.fullmatch(r"[A-Za-z_][\w.]*", columna) or not re.fullmatch(r"\w+", clave):
+        raise ValueError(f"Identificador no válido: {columna!r}, {clave!r}")
+    texto = f"(';' || {columna} || ';')"
+    inicio = f"instr({texto}, ';{clave}=') + {len(clave) + 2}"
+    return (
+        f"CASE WHEN instr({texto}, ';{clave}=') > 0 THEN "
+        f"NULLIF(substr({texto}, {inicio}, instr(substr({texto}, {inicio}), ';') - 1), '') END"
+    )
+
+def version_db():
+    """Sello de la última escritura: mtime de la base y de su archivo WAL.
+    Cambia con cada commit de cualquier módulo o proceso; se pasa como
+    argumento a las funciones cacheadas para que una escritura las invalide."""
+    sello = []
+    for ruta in (DB_PATH, DB_PATH.with_name(DB_PATH.name + "-wal")):
+        try:
+            sello.append(ruta.stat().st_mtime_ns)
+        except FileNotFoundError:
+            sello.append(0)
+    return tuple(sello)
+
 def init_db():
     """Inicializa la base de datos si no existe."""
     os.makedirs(DB_PATH.parent, exist_ok=True)
@@ -30,6 +228,7 @@ def init_db():
             nombre TEXT,
             atributos TEXT,
             password TEXT,
+            correo TEXT,
             activo INTEGER DEFAULT 1,
             fecha_creacion TEXT DEFAULT CURRENT_TIMESTAMP
         )
@@ -78,6 +277,7 @@ def init_db():
         )
     """)
 
+    conn.executescript(INDICES_AUP)
     conn.commit()
     conn.close()
     print("✅ Base de datos inicializada correctamente.")
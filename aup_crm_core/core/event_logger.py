@@ -1,4 +1,4 @@
-from .database import get_connection
+from .database import get_shared_connection, write_lock
 from .config_global import AUTH_ROLLBACK_MODE
 
 def registrar_evento(agente_id, accion, descripcion):
@@ -7,17 +7,13 @@ def registrar_evento(agente_id, accion, descripcion):
         print(f"⚠️ [Modo rollback] Evento no registrado: {accion} - {descripcion}")
         return
     
-    conn = get_connection()
-    if not conn:
-        return
-    
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO aup_eventos (agente_id, accion, descripcion)
-        VALUES (?, ?, ?)
-    """, (agente_id, accion, descripcion))
-    conn.commit()
-    conn.close()
+    conn = get_shared_connection()
+    with write_lock:
+        conn.execute("""
+            INSERT INTO aup_eventos (agente_id, accion, descripcion)
+            VALUES (?, ?, ?)
+        """, (agente_id, accion, descripcion))
+        conn.commit()
 
 def registrar_historial(entidad, valor_anterior, valor_nuevo, responsable):
     """Registra cambios en el historial (se desactiva en modo rollback)"""
@@ -25,14 +21,10 @@ def registrar_historial(entidad, valor_anterior, valor_nuevo, responsable):
         print(f"⚠️ [Modo rollback] Historial no registrado: {entidad}")
         return
     
-    conn = get_connection()
-    if not conn:
-        return
-    
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO aup_historial (entidad, valor_anterior, valor_nuevo, responsable)
-        VALUES (?, ?, ?, ?)
-    """, (entidad, valor_anterior, valor_nuevo, responsable))
-    conn.commit()
-    conn.close()
+    conn = get_shared_connection()
+    with write_lock:
+        conn.execute("""
+            INSERT INTO aup_historial (entidad, valor_anterior, valor_nuevo, responsable)
+            VALUES (?, ?, ?, ?)
+        """, (entidad, valor_anterior, valor_nuevo, responsable))
+        conn.commit()
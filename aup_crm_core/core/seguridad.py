@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Hash de contraseñas - scrypt con sal por usuario
+Sin dependencias de Streamlit: lo usan tanto la app como init_crm.py
+"""
+
+import hashlib
+import hmac
+import os
+
+# Costo de scrypt (n=2**14, r=8 ≈ 16 MiB y decenas de ms por verificación)
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_DKLEN = 32
+SAL_BYTES = 16
+
+PREFIJO_SCRYPT = "scrypt"
+
+
+def _scrypt(password, sal):
+    return hashlib.scrypt(password.encode(), salt=sal, n=SCRYPT_N, r=SCRYPT_R,
+                          p=SCRYPT_P, dklen=SCRYPT_DKLEN)
+
+
+def hash_password(password):
+    """Genera el valor almacenable: scrypt$<sal hex>$<hash hex> con sal aleatoria"""
+    sal = os.urandom(SAL_BYTES)
+    return f"{PREFIJO_SCRYPT}${sal.hex()}${_scrypt(password, sal).hex()}"
+
+
+def verificar_password(password, almacenado):
+    """
+    Compara en tiempo constante la contraseña contra el valor almacenado
+    Acepta también hashes heredados (sha256 hex sin sal)
+    """
+    if not almacenado:
+        return False
+
+    if almacenado.startswith(PREFIJO_SCRYPT + "$"):
+        try:
+            _, sal_hex, hash_hex = almacenado.split("$")
+            sal, esperado = bytes.fromhex(sal_hex), bytes.fromhex(hash_hex)
+        except ValueError:
+            return False
+        return hmac.compare_digest(_scrypt(password, sal), esperado)
+
+    heredado = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(heredado, almacenado)
+
+
+def requiere_rehash(almacenado):
+    """True si el valor almacenado es un hash heredado que debe migrarse a scrypt"""
+    return not (almacenado or "").startswith(PREFIJO_SCRYPT + "$")
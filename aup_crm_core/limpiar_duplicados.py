@@ -51,6 +51,8 @@ def limpiar_duplicados():
     print(f"\n{'='*70}")
     print("🔍 BUSCANDO DUPLICADOS...\n")
     
+    # El agrupamiento recorre en orden idx_agentes_nombre_norm (core.database,
+    # INDICES_AUP), sin B-tree temporal ni LOWER(TRIM()) por fila
     cur.execute("""
         SELECT LOWER(TRIM(nombre)) as nombre_lower, 
                COUNT(*) as cantidad, 
@@ -71,7 +73,9 @@ def limpiar_duplicados():
     # 4. Mostrar duplicados encontrados
     print(f"⚠️  Encontrados {len(duplicados)} grupo(s) de duplicados:\n")
     
-    total_eliminados = 0
+    # Se confirman todos los grupos y se eliminan al final en una sola transacción
+    ids_a_eliminar = []
+    eventos = []
     
     for dup in duplicados:
         ids = dup['ids'].split(',')
@@ -91,32 +95,38 @@ def limpiar_duplicados():
         respuesta = input().strip().lower()
         
         if respuesta == 's':
-            ids_a_eliminar = [int(id) for id in ids[1:]]
-            
-            for id_eliminar in ids_a_eliminar:
-                # Eliminar prospecto
-                cur.execute("DELETE FROM aup_agentes WHERE id=?", (id_eliminar,))
-                
-                # Limpiar relaciones huérfanas
-                cur.execute("DELETE FROM aup_relaciones WHERE agente_origen=? OR agente_destino=?", 
-                           (id_eliminar, id_eliminar))
-                
-                # Registrar en eventos
-                cur.execute("""
-                    INSERT INTO aup_eventos (agente_id, accion, descripcion)
-                    VALUES (?, ?, ?)
-                """, (id_eliminar, "Eliminación duplicado", 
-                      f"Registro duplicado eliminado (nombre: {dup['nombre_lower']})"))
-                
-                total_eliminados += 1
-            
-            conn.commit()
-            print(f"   ✅ Eliminados {len(ids_a_eliminar)} duplicado(s)")
+            ids_grupo = [int(id) for id in ids[1:]]
+            descripcion = f"Registro duplicado eliminado (nombre: {dup['nombre_lower']})"
+            ids_a_eliminar.extend(ids_grupo)
+            eventos.extend((i, "Eliminación duplicado", descripcion) for i in ids_grupo)
+            print(f"   ✅ Marcados {len(ids_grupo)} duplicado(s) para eliminar")
         else:
             print(f"   ⏭️  Omitido")
         
         print()
     
+    if ids_a_eliminar:
+        # CTE con los ids: cada id se enlaza una sola vez y ambas columnas de
+        # aup_relaciones lo buscan por su índice (MULTI-INDEX OR)
+        cte_ids = f"WITH ids(id) AS (VALUES {','.join(['(?)'] * len(ids_a_eliminar))})"
+        with conn:
+            # Eliminar prospectos
+            cur.execute(f"{cte_ids} DELETE FROM aup_agentes WHERE id IN ids", ids_a_eliminar)
+            
+            # Limpiar relaciones huérfanas
+            cur.execute(
+                f"{cte_ids} DELETE FROM aup_relaciones WHERE agente_origen IN ids OR agente_destino IN ids",
+                ids_a_eliminar
+            )
+            
+            # Registrar en eventos
+            cur.executemany("""
+                INSERT INTO aup_eventos (agente_id, accion, descripcion)
+                VALUES (?, ?, ?)
+            """, eventos)
+    
+    total_eliminados = len(ids_a_eliminar)
+    
     # 5. Mostrar resumen final
     print(f"{'='*70}")
     print(f"✅ PROCESO COMPLETADO")
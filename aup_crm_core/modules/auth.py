@@ -1,30 +1,33 @@
-import hashlib
 import streamlit as st
-from core.database import get_connection
+from core.database import conexion_lectura, get_shared_connection, write_lock
+from core.seguridad import hash_password, verificar_password, requiere_rehash
+from core.ui_utils import parse_atributos
 
-def hash_password(password):
-    """Genera un hash SHA-256 de la contraseña"""
-    return hashlib.sha256(password.encode()).hexdigest()
+# Texto SQL fijo: la conexión compartida reutiliza la sentencia preparada en
+# cada login. Sólo las columnas que usa iniciar_sesion más el hash a verificar
+_SQL_USUARIO_POR_CORREO = """
+    SELECT id, nombre, atributos, password FROM aup_agentes
+    WHERE tipo='usuario' AND correo=? AND activo=1
+"""
 
 def verificar_credenciales(correo, password):
-    """Verifica si las credenciales son correctas y retorna el usuario si es válido"""
-    conn = get_connection()
-    if not conn:
-        return None
+    """Verifica si las credenciales son correctas y retorna el usuario si es válido.
+    Los hashes heredados (sha256 sin sal) se migran a scrypt al iniciar sesión."""
+    with conexion_lectura() as conn:
+        candidatos = conn.execute(_SQL_USUARIO_POR_CORREO, (correo,)).fetchall()
     
-    password_hash = hash_password(password)
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT * FROM aup_agentes 
-        WHERE tipo='usuario' 
-        AND atributos LIKE ? 
-        AND password=? 
-        AND activo=1
-    """, (f"%correo={correo}%", password_hash))
-    
-    usuario = cur.fetchone()
-    conn.close()
-    return usuario
+    for usuario in candidatos:
+        if verificar_password(password, usuario["password"]):
+            if requiere_rehash(usuario["password"]):
+                # scrypt (~16 MiB, decenas de ms) fuera del lock: no bloquea a los escritores
+                nuevo_hash = hash_password(password)
+                conn = get_shared_connection()
+                with write_lock:
+                    conn.execute("UPDATE aup_agentes SET password=? WHERE id=?",
+                                 (nuevo_hash, usuario["id"]))
+                    conn.commit()
+            return usuario
+    return None
 
 def iniciar_sesion(correo, password):
     """Inicia sesión y guarda el usuario en session_state"""
@@ -34,12 +37,10 @@ def iniciar_sesion(correo, password):
         st.session_state['user_id'] = usuario['id']
         st.session_state['user_name'] = usuario['nombre']
         # Extraer rol de atributos
-        atributos = usuario['atributos']
-        rol = "Usuario"
-        if "rol=" in atributos:
-            rol_part = atributos.split("rol=")[1].split(";")[0]
-            rol = rol_part
+        rol = parse_atributos(usuario['atributos']).get("rol", "Usuario")
         st.session_state['user_role'] = rol
+        # Usuario actual ya armado: obtener_usuario_actual lo devuelve tal cual
+        st.session_state['_user_cache'] = {'id': usuario['id'], 'nombre': usuario['nombre'], 'rol': rol}
         return True
     return False
 
@@ -49,17 +50,14 @@ def cerrar_sesion():
     st.session_state['user_id'] = None
     st.session_state['user_name'] = None
     st.session_state['user_role'] = None
+    st.session_state['_user_cache'] = None
 
 def esta_autenticado():
     """Verifica si hay una sesión activa"""
     return st.session_state.get('logged_in', False)
 
 def obtener_usuario_actual():
-    """Retorna información del usuario actual"""
+    """Retorna información del usuario actual (dict armado en iniciar_sesion)"""
     if esta_autenticado():
-        return {
-            'id': st.session_state.get('user_id'),
-            'nombre': st.session_state.get('user_name'),
-            'rol': st.session_state.get('user_role')
-        }
+        return st.session_state.get('_user_cache')
     return None
@@ -6,12 +6,53 @@ Muestra solo prospectos con es_cliente=1 (REGLA R3)
 
 import streamlit as st
 from datetime import date, datetime
-from core.database import get_connection
+from core.database import conexion_lectura, get_shared_connection, sql_atributo, version_db, write_lock
 from core.event_logger import registrar_evento
 from core.config_global import RECORDIA_ENABLED, APP_VERSION
-from core.ui_utils import badge_estado, obtener_valor, validar_vigencia
+from core.ui_utils import badge_estado, parse_atributos, validar_vigencia
 import re
 
+# Tarjetas de cliente que se cargan por página ("Cargar más" agrega otra página)
+TAMANO_PAGINA_CLIENTES = 20
+
+# Texto SQL fijo de las escrituras: la conexión compartida reutiliza la
+# sentencia ya preparada (caché de sentencias de sqlite3) en cada clic
+_SQL_SET_ACTIVO = "UPDATE aup_agentes SET activo=? WHERE id=?"
+_SQL_EDITAR_CLIENTE = "UPDATE aup_agentes SET nombre=?, atributos=?, activo=? WHERE id=?"
+
+# Resumen de oportunidades por cliente agregado en SQLite (sin parsear ni sumar
+# cada oportunidad en Python); {marcadores} es la lista IN de ids del bloque
+_ESTADO_OP = sql_atributo("a.atributos", "estado")
+_SQL_RESUMEN_OPORTUNIDADES = f"""
+    SELECT r.agente_origen, COUNT(*),
+           COUNT(CASE WHEN {_ESTADO_OP} = 'Ganada' THEN 1 END),
+           TOTAL(CASE WHEN {_ESTADO_OP} = 'Ganada'
+                      THEN CAST({sql_atributo("a.atributos", "monto")} AS REAL) END)
+    FROM aup_agentes a
+    INNER JOIN aup_relaciones r ON r.agente_destino = a.id
+    WHERE r.tipo_relacion = 'tiene_oportunidad' AND r.agente_origen IN {{marcadores}}
+    GROUP BY r.agente_origen
+"""
+
+# Opciones de "Ordenar por" → ORDER BY del listado (el orden lo resuelve SQLite).
+# Sin fecha de conversión se ordena como "—" (mismo orden que el sort previo en Python)
+_ORDEN_CLIENTES = {
+    "Fecha conversión (reciente)": (
+        f"COALESCE({sql_atributo('atributos', 'fecha_conversion_cliente')}, '—') DESC, "
+        "fecha_creacion DESC"
+    ),
+    "Nombre (A-Z)": "nombre, fecha_creacion DESC",
+    "Más antiguo": "fecha_creacion",
+}
+
+# Estados de prospecto → estado de cliente equivalente (al editar un cliente convertido)
+MAPEO_ESTADOS_PROSPECTO = {
+    "Nuevo": "Activo",
+    "En negociación": "Activo",
+    "Cerrado": "Activo",
+    "Perdido": "Suspendido"
+}
+
 
 def show():
     """Interfaz principal del módulo de clientes - Vista de prospectos convertidos"""
@@ -19,23 +60,18 @@ def show():
     
     st.info("💡 Los clientes son prospectos que ganaron al menos una oportunidad y se convirtieron automáticamente.")
     
-    # Obtener PROSPECTOS que son clientes (es_cliente=1)
-    conn = get_connection()
-    if not conn:
-        st.error("Error al conectar con la base de datos")
+    # Edición en curso: la fila ya viene de cargar_clientes() vía session_state
+    if "editar_cliente" in st.session_state:
+        editar_cliente(st.session_state["editar_cliente"])
         return
-        
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT * FROM aup_agentes 
-        WHERE tipo='prospecto'
-        ORDER BY fecha_creacion DESC
-    """)
-    todos_prospectos = cur.fetchall()
-    conn.close()
     
-    # Filtrar solo los que son clientes
-    clientes = [p for p in todos_prospectos if obtener_valor(p["atributos"], "es_cliente") == "1"]
+    # Sello de la base: si otro módulo (p. ej. oportunidades al convertir un
+    # prospecto) escribió desde la última carga, las cachés no se reutilizan
+    version = version_db()
+    # El selectbox (más abajo) guarda su valor en session_state antes del rerun,
+    # así el orden elegido ya viene aplicado desde SQLite
+    orden = st.session_state.get("orden_clientes", next(iter(_ORDEN_CLIENTES)))
+    clientes = cargar_clientes(orden, version)
     
     if not clientes:
         st.warning("📋 No hay clientes registrados aún.")
@@ -49,7 +85,7 @@ def show():
         mostrar_inactivos = st.checkbox("Mostrar inactivos", value=False)
     with col2:
         # Ordenar por
-        orden = st.selectbox("Ordenar por", ["Fecha conversión (reciente)", "Nombre (A-Z)", "Más antiguo"])
+        st.selectbox("Ordenar por", list(_ORDEN_CLIENTES), key="orden_clientes")
     with col3:
         st.metric("Total clientes", len(clientes))
     
@@ -57,86 +93,160 @@ def show():
     
     # Aplicar filtros
     clientes_filtrados = []
-    for c in clientes:
-        if not mostrar_inactivos and not c["activo"]:
+    for cliente in clientes:
+        if not mostrar_inactivos and not cliente["agente"]["activo"]:
             continue
-        clientes_filtrados.append(c)
+        clientes_filtrados.append(cliente)
+    
+    # Paginación: sólo las tarjetas visibles cargan contactos y oportunidades.
+    # "Cargar más" vale para el orden y filtro con que se pulsó: si cambian,
+    # se vuelve a la primera página
+    clave_paginacion = (orden, mostrar_inactivos)
+    if st.session_state.get("clientes_visibles_clave") != clave_paginacion:
+        reiniciar_paginacion()
+        st.session_state["clientes_visibles_clave"] = clave_paginacion
+    visibles = st.session_state.get("clientes_visibles", TAMANO_PAGINA_CLIENTES)
+    pagina = clientes_filtrados[:visibles]
     
-    # Ordenar
-    if orden == "Nombre (A-Z)":
-        clientes_filtrados.sort(key=lambda x: x["nombre"])
-    elif orden == "Más antiguo":
-        clientes_filtrados.sort(key=lambda x: x["fecha_creacion"])
-    else:  # Fecha conversión reciente
-        clientes_filtrados.sort(
-            key=lambda x: obtener_valor(x["atributos"], "fecha_conversion_cliente"), 
-            reverse=True
-        )
+    st.caption(f"Mostrando {len(pagina)} de {len(clientes_filtrados)} clientes filtrados ({len(clientes)} en total)")
     
-    st.caption(f"Mostrando {len(clientes_filtrados)} de {len(clientes)} clientes")
+    # Resumen por bloques de página: cada bloque queda en caché por separado,
+    # así "Cargar más" sólo consulta las tarjetas nuevas
+    resumenes = {}
+    for inicio in range(0, len(pagina), TAMANO_PAGINA_CLIENTES):
+        bloque = pagina[inicio:inicio + TAMANO_PAGINA_CLIENTES]
+        resumenes.update(cargar_resumen_clientes(tuple(cliente["agente"]["id"] for cliente in bloque), version))
     
     # Mostrar tarjetas
-    for c in clientes_filtrados:
-        mostrar_tarjeta_cliente(c)
+    for cliente in pagina:
+        mostrar_tarjeta_cliente({**cliente, **resumenes[cliente["agente"]["id"]]}, mostrar_inactivos)
+    
+    if len(clientes_filtrados) > visibles:
+        if st.button("⬇️ Cargar más", use_container_width=True):
+            st.session_state["clientes_visibles"] = visibles + TAMANO_PAGINA_CLIENTES
+            st.rerun()
+
+
+def reiniciar_paginacion():
+    """Descarta las páginas extra de "Cargar más" (al cambiar orden, filtro o sección)."""
+    st.session_state.pop("clientes_visibles", None)
+    st.session_state.pop("clientes_visibles_clave", None)
 
 
-def mostrar_tarjeta_cliente(c):
-    """Muestra la tarjeta de un cliente (prospecto convertido)"""
-    atributos = c["atributos"] or ""
+@st.cache_data(ttl=60, show_spinner=False)
+def cargar_clientes(orden, version):
+    """
+    Clientes (prospectos con es_cliente=1) con sus atributos ya parseados,
+    ordenados en SQLite según orden (clave de _ORDEN_CLIENTES)
+    Cacheado 60 s: los reruns por filtros u orden no vuelven a parsear ni a
+    consultar; las escrituras de este módulo lo invalidan (invalidar_clientes)
+    y las de otros módulos cambian version (sello de version_db())
+    """
+    # Filtro exacto en SQLite: con ';' a ambos lados, instr sólo encuentra el
+    # segmento completo "es_cliente=1" (no es_cliente=10 ni otra clave con ese
+    # sufijo); los prospectos que no son clientes no llegan a Python
+    with conexion_lectura() as conn:
+        prospectos = conn.execute(f"""
+            SELECT * FROM aup_agentes 
+            WHERE tipo='prospecto'
+            AND instr(';' || atributos || ';', ';es_cliente=1;') > 0
+            ORDER BY {_ORDEN_CLIENTES[orden]}
+        """).fetchall()
     
-    # Parsear atributos
-    sector = obtener_valor(atributos, "sector")
-    telefono = obtener_valor(atributos, "telefono")
-    fecha_conversion = obtener_valor(atributos, "fecha_conversion_cliente")
-    estado = obtener_valor(atributos, "estado")
+    # Parsear atributos una sola vez por cliente
+    return [{"agente": dict(p), "attrs": parse_atributos(p["atributos"])} for p in prospectos]
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cargar_resumen_clientes(ids, version):
+    """
+    Contactos y resumen de oportunidades de un bloque de clientes (tupla de ids)
+    version: sello de version_db(), sólo forma parte de la clave de caché
+    Retorna: {id: {contactos_count, empresa_nombre, oportunidades_total,
+                   oportunidades_ganadas, monto_total_ganado}}
+    """
+    # Relaciones del bloque en dos consultas ya agregadas (no 3 por cliente)
+    with conexion_lectura() as conn:
+        contactos_por_cliente, oportunidades_por_cliente = cargar_relaciones_clientes(conn, list(ids))
     
-    # Obtener empresa origen y oportunidades
-    conn = get_connection()
-    empresa_nombre = "—"
-    contactos_count = 0
-    oportunidades_total = 0
-    oportunidades_ganadas = 0
-    monto_total_ganado = 0.0
+    resumenes = {}
+    for id_cliente in ids:
+        contactos_count, empresa_nombre = contactos_por_cliente.get(id_cliente, (0, None))
+        total, ganadas, monto_ganado = oportunidades_por_cliente.get(id_cliente, (0, 0, 0.0))
+        resumenes[id_cliente] = {
+            "contactos_count": contactos_count,
+            "empresa_nombre": empresa_nombre or "—",
+            "oportunidades_total": total,
+            "oportunidades_ganadas": ganadas,
+            "monto_total_ganado": monto_ganado,
+        }
+    return resumenes
+
+
+def invalidar_clientes():
+    """Invalida el listado y los resúmenes cacheados tras una escritura"""
+    cargar_clientes.clear()
+    cargar_resumen_clientes.clear()
+
+
+def cargar_relaciones_clientes(conn, ids):
+    """
+    Carga en bloque los contactos ('tiene_contacto') y las oportunidades
+    ('tiene_oportunidad') de los clientes indicados
+    Retorna: (contactos_por_cliente, oportunidades_por_cliente) por id, ya
+    agregados en SQLite: contactos como (total, nombre de la empresa origen) y
+    oportunidades como (total, ganadas, monto ganado)
+    """
+    contactos_por_cliente = {}
+    oportunidades_por_cliente = {}
+    if not ids:
+        return contactos_por_cliente, oportunidades_por_cliente
     
-    if conn:
-        cur = conn.cursor()
-        
-        # Obtener empresa origen
-        cur.execute("""
-            SELECT a.nombre FROM aup_agentes a
-            INNER JOIN aup_relaciones r ON r.agente_destino = a.id
-            WHERE r.agente_origen = ? AND r.tipo_relacion = 'tiene_contacto'
-            LIMIT 1
-        """, (c["id"],))
-        empresa = cur.fetchone()
-        if empresa:
-            empresa_nombre = empresa["nombre"]
-        
-        # Contar contactos
-        cur.execute("""
-            SELECT COUNT(*) as total FROM aup_relaciones
-            WHERE agente_origen = ? AND tipo_relacion = 'tiene_contacto'
-        """, (c["id"],))
-        contactos_count = cur.fetchone()["total"]
-        
-        # Contar oportunidades y calcular monto ganado
-        cur.execute("""
-            SELECT a.* FROM aup_agentes a
-            INNER JOIN aup_relaciones r ON r.agente_destino = a.id
-            WHERE r.agente_origen = ? AND r.tipo_relacion = 'tiene_oportunidad'
-        """, (c["id"],))
-        oportunidades = cur.fetchall()
-        oportunidades_total = len(oportunidades)
-        
-        for o in oportunidades:
-            estado_op = obtener_valor(o["atributos"], "estado")
-            if estado_op == "Ganada":
-                oportunidades_ganadas += 1
-                monto = obtener_valor(o["atributos"], "monto")
-                if monto != "—":
-                    monto_total_ganado += float(monto)
-        
-        conn.close()
+    marcadores = f"({','.join('?' * len(ids))})"
+    cur = conn.cursor()
+    
+    # Una fila por cliente: LEFT JOIN para que el conteo incluya relaciones cuyo
+    # agente ya no existe; con un único MIN() en la consulta, SQLite toma a.nombre
+    # de esa misma fila, es decir, del primer contacto (por r.id) con nombre
+    cur.execute(f"""
+        SELECT r.agente_origen, COUNT(*), a.nombre,
+               MIN(CASE WHEN a.nombre IS NOT NULL THEN r.id END)
+        FROM aup_relaciones r
+        LEFT JOIN aup_agentes a ON a.id = r.agente_destino
+        WHERE r.tipo_relacion = 'tiene_contacto' AND r.agente_origen IN {marcadores}
+        GROUP BY r.agente_origen
+    """, ids)
+    for origen, total, empresa, _ in cur.fetchall():
+        contactos_por_cliente[origen] = (total, empresa)
+    
+    cur.execute(_SQL_RESUMEN_OPORTUNIDADES.format(marcadores=marcadores), ids)
+    for origen, total, ganadas, monto_ganado in cur.fetchall():
+        oportunidades_por_cliente[origen] = (total, ganadas, monto_ganado)
+    
+    return contactos_por_cliente, oportunidades_por_cliente
+
+
+@st.fragment
+def mostrar_tarjeta_cliente(cliente, mostrar_inactivos=True):
+    """
+    Muestra la tarjeta de un cliente (prospecto convertido): fila de cargar_clientes()
+    más su resumen de cargar_resumen_clientes()
+    Fragmento: activar/desactivar y ver contactos sólo vuelven a pintar esta tarjeta,
+    salvo que la tarjeta deba salir del listado filtrado (rerun completo)
+    """
+    c = cliente["agente"]
+    attrs = cliente["attrs"]
+    
+    sector = attrs.get("sector", "—")
+    telefono = attrs.get("telefono", "—")
+    fecha_conversion = attrs.get("fecha_conversion_cliente", "—")
+    estado = attrs.get("estado", "—")
+    
+    empresa_nombre = cliente["empresa_nombre"]
+    contactos_count = cliente["contactos_count"]
+    oportunidades_total = cliente["oportunidades_total"]
+    oportunidades_ganadas = cliente["oportunidades_ganadas"]
+    monto_total_ganado = cliente["monto_total_ganado"]
     
     with st.container(border=True):
         # Encabezado con indicador de cliente
@@ -169,55 +279,58 @@ def mostrar_tarjeta_cliente(c):
                 st.error("❌ Cliente inactivo")
         
         # Botones de acción
-        col1, col2, col3 = st.columns(3)
+        col1, col2, col3, col4 = st.columns(4)
         
         with col1:
+            if st.button("✏️ Editar", key=f"edit_cli_{c['id']}", use_container_width=True):
+                st.session_state["editar_cliente"] = c
+                st.rerun()
+        
+        with col2:
             if st.button("📈 Ver oportunidades", key=f"ver_op_cli_{c['id']}", use_container_width=True):
                 # Redirigir al módulo de oportunidades con este prospecto
                 st.session_state["prospecto_id_oportunidad"] = c["id"]
                 st.session_state["prospecto_nombre_oportunidad"] = c["nombre"]
                 st.switch_page("pages/oportunidades.py") if hasattr(st, 'switch_page') else st.info("Ir a módulo Oportunidades")
         
-        with col2:
+        with col3:
             if st.button("👤 Ver contactos", key=f"ver_cont_cli_{c['id']}", use_container_width=True):
                 ver_contactos_cliente(c["id"], c["nombre"])
         
-        with col3:
+        with col4:
             if c["activo"]:
                 if st.button("❌ Desactivar", key=f"deact_cli_{c['id']}", use_container_width=True):
                     desactivar_cliente(c["id"], c["nombre"])
-                    st.rerun()
+                    c["activo"] = 0
+                    # Con inactivos ocultos la tarjeta desaparece: hay que repintar la página
+                    st.rerun(scope="fragment" if mostrar_inactivos else "app")
             else:
                 if st.button("✅ Activar", key=f"act_cli_{c['id']}", use_container_width=True):
                     activar_cliente(c["id"], c["nombre"])
-                    st.rerun()
+                    c["activo"] = 1
+                    st.rerun(scope="fragment")
 
 
 def ver_contactos_cliente(cliente_id, cliente_nombre):
     """Muestra los contactos asociados al cliente"""
-    conn = get_connection()
-    if not conn:
-        return
-    
     st.markdown(f"### 📇 Contactos de {cliente_nombre}")
     
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT a.* FROM aup_agentes a
-        INNER JOIN aup_relaciones r ON r.agente_destino = a.id
-        WHERE r.agente_origen = ? AND r.tipo_relacion = 'tiene_contacto'
-    """, (cliente_id,))
-    contactos = cur.fetchall()
-    conn.close()
+    with conexion_lectura() as conn:
+        contactos = conn.execute("""
+            SELECT a.* FROM aup_agentes a
+            INNER JOIN aup_relaciones r ON r.agente_destino = a.id
+            WHERE r.agente_origen = ? AND r.tipo_relacion = 'tiene_contacto'
+        """, (cliente_id,)).fetchall()
     
     if not contactos:
         st.info("No hay contactos registrados")
         return
     
     for c in contactos:
-        cargo = obtener_valor(c["atributos"], "cargo")
-        telefono = obtener_valor(c["atributos"], "telefono")
-        correo = obtener_valor(c["atributos"], "correo")
+        attrs = parse_atributos(c["atributos"])
+        cargo = attrs.get("cargo", "—")
+        telefono = attrs.get("telefono", "—")
+        correo = attrs.get("correo", "—")
         
         with st.container(border=True):
             st.markdown(f"**{c['nombre']}** — {cargo}")
@@ -226,157 +339,42 @@ def ver_contactos_cliente(cliente_id, cliente_nombre):
 
 def desactivar_cliente(cliente_id, nombre):
     """Desactiva un cliente (prospecto convertido)"""
-    conn = get_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE aup_agentes SET activo=0 WHERE id=?", (cliente_id,))
+    conn = get_shared_connection()
+    with write_lock:
+        conn.execute(_SQL_SET_ACTIVO, (0, cliente_id))
         conn.commit()
-        conn.close()
-        registrar_evento(cliente_id, "Desactivación cliente", f"Cliente '{nombre}' desactivado")
-        st.success(f"✅ Cliente '{nombre}' desactivado")
+    invalidar_clientes()
+    registrar_evento(cliente_id, "Desactivación cliente", f"Cliente '{nombre}' desactivado")
+    st.success(f"✅ Cliente '{nombre}' desactivado")
 
 
 def activar_cliente(cliente_id, nombre):
     """Activa un cliente"""
-    conn = get_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE aup_agentes SET activo=1 WHERE id=?", (cliente_id,))
+    conn = get_shared_connection()
+    with write_lock:
+        conn.execute(_SQL_SET_ACTIVO, (1, cliente_id))
         conn.commit()
-        conn.close()
-        registrar_evento(cliente_id, "Activación cliente", f"Cliente '{nombre}' activado")
-        st.success(f"✅ Cliente '{nombre}' activado")
-
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT agente_origen FROM aup_relaciones 
-            WHERE agente_destino = ? AND tipo_relacion = 'convertido_en'
-        """, (c["id"],))
-        resultado = cur.fetchone()
-        if resultado:
-            prospecto_id = resultado["agente_origen"]
-        conn.close()
-    
-    # Estilo atenuado para clientes inactivos
-    if not c["activo"]:
-        st.markdown("<div style='opacity: 0.6;'>", unsafe_allow_html=True)
-    
-    with st.container(border=True):
-        col1, col2, col3 = st.columns([3, 1, 1])
-        
-        with col1:
-            st.markdown(f"### 💼 {c['nombre']}")
-            st.caption(f"**Sector:** {sector} | **📞 Tel. empresa:** {telefono_empresa}")
-            st.caption(f"{badge} **Estado:** {estado} | **Vigencia:** {vigencia_str}")
-            
-            # Indicador visual de expiración
-            if estado_vigencia == "vencida":
-                st.error(f"⚠️ Vigencia vencida hace {dias_restantes} días")
-            elif estado_vigencia == "próxima":
-                st.warning(f"⏰ Vigencia próxima a vencer en {dias_restantes} días")
-            
-            if prospecto_id:
-                st.caption(f"🔄 Convertido desde prospecto ID: {prospecto_id}")
-            if not c["activo"]:
-                st.warning("⚠️ Cliente inactivo")
-        
-        with col2:
-            st.caption(f"ID: {c['id']}")
-            st.caption(f"📅 {c['fecha_creacion'][:10]}")
-        
-        with col3:
-            if c["activo"]:
-                st.success("✅ Activo")
-            else:
-                st.error("❌ Inactivo")
-        
-        # Mostrar contactos asociados
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT a.* FROM aup_agentes a
-                INNER JOIN aup_relaciones r ON a.id = r.agente_destino
-                WHERE r.agente_origen = ? AND r.tipo_relacion IN ('contacto_principal', 'tiene_contacto')
-                ORDER BY a.fecha_creacion DESC
-            """, (c["id"],))
-            contactos = cur.fetchall()
-            conn.close()
-            
-            if contactos:
-                st.markdown("**📇 Contactos principales:**")
-                for contacto in contactos:
-                    nombre_contacto = contacto["nombre"]
-                    telefono_contacto = obtener_valor(contacto["atributos"], "telefono_contacto")
-                    correo = obtener_valor(contacto["atributos"], "correo")
-                    cargo = obtener_valor(contacto["atributos"], "cargo")
-                    
-                    estado_contacto = "✅" if contacto["activo"] else "❌"
-                    st.write(f"  {estado_contacto} **{nombre_contacto}** — {cargo} | 📞 {telefono_contacto} | ✉️ {correo}")
-                
-                st.caption(f"Total de contactos: {len(contactos)}")
-            else:
-                st.info("💡 Sin contactos asociados")
-        
-        # Botones de acción
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            if st.button(f"✏️ Editar", key=f"edit_{c['id']}", use_container_width=True):
-                st.session_state["editar_cliente"] = c["id"]
-                st.rerun()
-        
-        with col2:
-            if st.button("📊 Ver oportunidades", key=f"ver_oportunidades_{c['id']}", use_container_width=True):
-                # Navegar al módulo de Oportunidades con cliente preseleccionado
-                st.session_state["cliente_seleccionado"] = c["id"]
-                st.session_state["cliente_nombre"] = c["nombre"]
-                st.session_state["pagina_actual"] = "Oportunidades"
-                st.rerun()
-        
-        with col3:
-            texto_btn = "❌ Desactivar" if c["activo"] else "✅ Activar"
-            if st.button(texto_btn, key=f"toggle_{c['id']}", type="secondary", use_container_width=True):
-                toggle_activo(c["id"], c["nombre"], c["activo"])
-                st.rerun()
-    
-    # Cerrar div de estilo atenuado para clientes inactivos
-    if not c["activo"]:
-        st.markdown("</div>", unsafe_allow_html=True)
+    invalidar_clientes()
+    registrar_evento(cliente_id, "Activación cliente", f"Cliente '{nombre}' activado")
+    st.success(f"✅ Cliente '{nombre}' activado")
 
 
-def editar_cliente(cliente_id):
-    """Permite editar los datos clave del cliente"""
-    conn = get_connection()
-    if not conn:
-        st.error("Error de conexión")
-        return
-        
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM aup_agentes WHERE id=?", (cliente_id,))
-    c = cur.fetchone()
-    conn.close()
-
-    if not c:
-        st.error("❌ Cliente no encontrado.")
-        return
+def editar_cliente(c):
+    """
+    Permite editar los datos clave del cliente
+    c: fila del cliente (dict) ya cargada por cargar_clientes(), sin volver a consultarla
+    """
+    cliente_id = c["id"]
 
     st.subheader(f"✏️ Editar cliente: {c['nombre']}")
     
     # Obtener valores actuales
-    atributos = c["atributos"] or ""
-    estado_actual = obtener_valor(atributos, "estado")
+    attrs = parse_atributos(c["atributos"])
+    estado_actual = attrs.get("estado", "—")
     
     # Si el estado viene del prospecto original, mapearlo a estados de cliente
-    mapeo_estados = {
-        "Nuevo": "Activo",
-        "En negociación": "Activo",
-        "Cerrado": "Activo",
-        "Perdido": "Suspendido"
-    }
-    
-    if estado_actual in mapeo_estados:
-        estado_actual = mapeo_estados[estado_actual]
+    if estado_actual in MAPEO_ESTADOS_PROSPECTO:
+        estado_actual = MAPEO_ESTADOS_PROSPECTO[estado_actual]
     elif estado_actual == "—":
         estado_actual = "Activo"
     
@@ -385,15 +383,15 @@ def editar_cliente(cliente_id):
         
         col1, col2 = st.columns(2)
         with col1:
-            sector = st.text_input("Sector", value=obtener_valor(atributos, "sector"))
-            telefono_empresa = st.text_input("📞 Teléfono empresa", value=obtener_valor(atributos, "telefono_empresa"))
+            sector = st.text_input("Sector", value=attrs.get("sector", "—"))
+            telefono_empresa = st.text_input("📞 Teléfono empresa", value=attrs.get("telefono_empresa", "—"))
         with col2:
             estados_cliente = ["Activo", "Suspendido", "No renovado"]
             idx = estados_cliente.index(estado_actual) if estado_actual in estados_cliente else 0
             estado = st.selectbox("Estado del cliente", estados_cliente, index=idx)
             
             # Manejar vigencia
-            vigencia_str = obtener_valor(atributos, "vigencia")
+            vigencia_str = attrs.get("vigencia", "—")
             try:
                 vigencia_actual = date.fromisoformat(vigencia_str) if vigencia_str != "—" else date.today()
             except:
@@ -424,42 +422,40 @@ def editar_cliente(cliente_id):
         
         nuevos_atributos = f"sector={sector};telefono_empresa={telefono_empresa};estado={estado};vigencia={vigencia}"
         
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute(
-                "UPDATE aup_agentes SET nombre=?, atributos=?, activo=? WHERE id=?",
+        conn = get_shared_connection()
+        with write_lock:
+            conn.execute(
+                _SQL_EDITAR_CLIENTE,
                 (nombre, nuevos_atributos, 1 if activo else 0, cliente_id)
             )
             conn.commit()
-            conn.close()
-            
-            registrar_evento(cliente_id, "Edición cliente", f"Cliente '{nombre}' actualizado. Estado: {estado}")
-            
-            # Gancho para integración futura con Recordia-Bridge (registro forense)
-            if RECORDIA_ENABLED:
-                registrar_evento(
-                    cliente_id, 
-                    "Sync Recordia", 
-                    f"Cliente '{nombre}' actualizado y registrado en ledger {APP_VERSION}."
-                )
-            
-            st.success("✅ Cliente actualizado correctamente.")
-            del st.session_state["editar_cliente"]
-            st.rerun()
+        invalidar_clientes()
+        
+        registrar_evento(cliente_id, "Edición cliente", f"Cliente '{nombre}' actualizado. Estado: {estado}")
+        
+        # Gancho para integración futura con Recordia-Bridge (registro forense)
+        if RECORDIA_ENABLED:
+            registrar_evento(
+                cliente_id, 
+                "Sync Recordia", 
+                f"Cliente '{nombre}' actualizado y registrado en ledger {APP_VERSION}."
+            )
+        
+        st.success("✅ Cliente actualizado correctamente.")
+        del st.session_state["editar_cliente"]
+        st.rerun()
 
 
 def toggle_activo(cliente_id, nombre, activo_actual):
     """Activa/desactiva cliente"""
     nuevo_estado = 0 if activo_actual else 1
     
-    conn = get_connection()
-    if conn:
-        cur = conn.cursor()
-        cur.execute("UPDATE aup_agentes SET activo=? WHERE id=?", (nuevo_estado, cliente_id))
+    conn = get_shared_connection()
+    with write_lock:
+        conn.execute(_SQL_SET_ACTIVO, (nuevo_estado, cliente_id))
         conn.commit()
-        conn.close()
-        
-        accion = "activado" if nuevo_estado else "desactivado"
-        registrar_evento(cliente_id, "Cambio estado", f"Cliente '{nombre}' {accion}")
-        st.success(f"✅ Cliente {accion}")
+    invalidar_clientes()
+    
+    accion = "activado" if nuevo_estado else "desactivado"
+    registrar_evento(cliente_id, "Cambio estado", f"Cliente '{nombre}' {accion}")
+    st.success(f"✅ Cliente {accion}")
@@ -6,9 +6,9 @@ Empresa → Contactos → [Generar Prospecto]
 
 import streamlit as st
 from datetime import date
-from core.database import get_connection
+from core.database import conexion_lectura, get_connection
 from core.event_logger import registrar_evento
-from core.ui_utils import obtener_valor
+from core.ui_utils import obtener_valor, parse_atributos
 import re
 
 
@@ -53,15 +53,12 @@ def show():
     # Listado de empresas
     st.subheader("📋 Listado de Empresas")
     
-    conn = get_connection()
-    if not conn:
-        st.error("Error de conexión")
-        return
-        
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM aup_agentes WHERE tipo='empresa' ORDER BY nombre ASC")
-    empresas = cur.fetchall()
-    conn.close()
+    # Lecturas del listado y de las tarjetas: pool de solo lectura (sin abrir y
+    # cerrar el archivo en cada tarjeta)
+    with conexion_lectura() as conn:
+        empresas = conn.execute(
+            "SELECT * FROM aup_agentes WHERE tipo='empresa' ORDER BY nombre ASC"
+        ).fetchall()
     
     if not empresas:
         st.info("No hay empresas registradas aún.")
@@ -96,39 +93,32 @@ def show():
 
 def mostrar_tarjeta_empresa(e):
     """Muestra la tarjeta de una empresa con contactos y botón generar prospecto"""
-    atributos = e["atributos"] or ""
+    # Atributos parseados una sola vez por tarjeta
+    attrs = parse_atributos(e["atributos"])
     
-    sector = obtener_valor(atributos, "sector")
-    telefono = obtener_valor(atributos, "telefono")
-    direccion = obtener_valor(atributos, "direccion")
-    rfc = obtener_valor(atributos, "rfc")
+    sector = attrs.get("sector", "—")
+    telefono = attrs.get("telefono", "—")
+    direccion = attrs.get("direccion", "—")
+    rfc = attrs.get("rfc", "—")
     
-    # Obtener contactos
-    conn = get_connection()
-    contactos = []
     prospecto_id = None
     
-    if conn:
-        cur = conn.cursor()
+    with conexion_lectura() as conn:
         # Obtener contactos asociados
-        cur.execute("""
+        contactos = conn.execute("""
             SELECT a.* FROM aup_agentes a
             INNER JOIN aup_relaciones r ON r.agente_destino = a.id
             WHERE r.agente_origen = ? AND r.tipo_relacion = 'tiene_contacto'
             AND a.activo = 1
-        """, (e["id"],))
-        contactos = cur.fetchall()
+        """, (e["id"],)).fetchall()
         
         # Verificar si ya tiene prospecto generado
-        cur.execute("""
+        resultado = conn.execute("""
             SELECT agente_destino FROM aup_relaciones
             WHERE agente_origen = ? AND tipo_relacion = 'genero_prospecto'
-        """, (e["id"],))
-        resultado = cur.fetchone()
-        if resultado:
-            prospecto_id = resultado["agente_destino"]
-        
-        conn.close()
+        """, (e["id"],)).fetchone()
+    if resultado:
+        prospecto_id = resultado["agente_destino"]
     
     tiene_contactos = len(contactos) > 0
     opacity = "opacity: 0.6;" if not e["activo"] else ""
@@ -156,9 +146,10 @@ def mostrar_tarjeta_empresa(e):
             with st.expander(f"📇 Ver contactos ({len(contactos)})"):
                 for c in contactos:
                     nombre_contacto = c["nombre"]
-                    cargo = obtener_valor(c["atributos"], "cargo")
-                    telefono_contacto = obtener_valor(c["atributos"], "telefono")
-                    correo = obtener_valor(c["atributos"], "correo")
+                    attrs_contacto = parse_atributos(c["atributos"])
+                    cargo = attrs_contacto.get("cargo", "—")
+                    telefono_contacto = attrs_contacto.get("telefono", "—")
+                    correo = attrs_contacto.get("correo", "—")
                     st.write(f"**{nombre_contacto}** — {cargo}")
                     st.caption(f"📞 {telefono_contacto} | ✉️ {correo}")
                     st.divider()
@@ -7,9 +7,9 @@ Teléfonos diferenciados: empresa (prospecto) y personal (contacto)
 
 import streamlit as st
 from datetime import date, timedelta
-from core.database import get_connection
+from core.database import conexion_lectura, get_connection
 from core.event_logger import registrar_evento
-from core.ui_utils import badge_estado, obtener_valor
+from core.ui_utils import badge_estado, obtener_valor, parse_atributos
 import re
 
 
@@ -55,15 +55,12 @@ def show():
     # Listado de prospectos
     st.subheader("📋 Listado de Prospectos")
     
-    conn = get_connection()
-    if not conn:
-        st.error("Error de conexión")
-        return
-        
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM aup_agentes WHERE tipo=? ORDER BY fecha_creacion DESC", ("prospecto",))
-    prospectos = cur.fetchall()
-    conn.close()
+    # Lecturas del listado y de las tarjetas: pool de solo lectura (sin abrir y
+    # cerrar el archivo en cada tarjeta)
+    with conexion_lectura() as conn:
+        prospectos = conn.execute(
+            "SELECT * FROM aup_agentes WHERE tipo=? ORDER BY fecha_creacion DESC", ("prospecto",)
+        ).fetchall()
     
     if not prospectos:
         st.info("No hay prospectos registrados aún.")
@@ -118,13 +115,12 @@ def show():
 
 def mostrar_tarjeta_prospecto(p):
     """Muestra la tarjeta de un prospecto con sus detalles y contactos"""
-    atributos = p["atributos"] or ""
-    
-    # Parsear atributos con la función auxiliar
-    estado = obtener_valor(atributos, "estado")
-    sector = obtener_valor(atributos, "sector")
-    telefono_empresa = obtener_valor(atributos, "telefono_empresa")
-    vigencia = obtener_valor(atributos, "vigencia")
+    # Parsear atributos una sola vez por tarjeta
+    attrs = parse_atributos(p["atributos"])
+    estado = attrs.get("estado", "—")
+    sector = attrs.get("sector", "—")
+    telefono_empresa = attrs.get("telefono_empresa", "—")
+    vigencia = attrs.get("vigencia", "—")
     
     # Usar badge centralizado (mantiene emoji + color para prospectos)
     badge = badge_estado(estado)
@@ -159,32 +155,29 @@ def mostrar_tarjeta_prospecto(p):
                 st.error("❌ Inactivo")
         
         # Mostrar contactos asociados
-        conn = get_connection()
-        if conn:
-            cur = conn.cursor()
-            cur.execute("""
+        with conexion_lectura() as conn:
+            contactos = conn.execute("""
                 SELECT a.* FROM aup_agentes a
                 INNER JOIN aup_relaciones r ON a.id = r.agente_destino
                 WHERE r.agente_origen = ? AND r.tipo_relacion = 'tiene_contacto'
                 ORDER BY a.fecha_creacion DESC
-            """, (p["id"],))
-            contactos = cur.fetchall()
-            conn.close()
-            
-            if contactos:
-                st.markdown("**📇 Contactos asociados:**")
-                for c in contactos:
-                    nombre_contacto = c["nombre"]
-                    telefono_contacto = obtener_valor(c["atributos"], "telefono_contacto")
-                    correo = obtener_valor(c["atributos"], "correo")
-                    cargo = obtener_valor(c["atributos"], "cargo")
-                    
-                    estado_contacto = "✅" if c["activo"] else "❌"
-                    st.write(f"  {estado_contacto} **{nombre_contacto}** — {cargo} | 📞 {telefono_contacto} | ✉️ {correo}")
+            """, (p["id"],)).fetchall()
+        
+        if contactos:
+            st.markdown("**📇 Contactos asociados:**")
+            for c in contactos:
+                nombre_contacto = c["nombre"]
+                attrs_contacto = parse_atributos(c["atributos"])
+                telefono_contacto = attrs_contacto.get("telefono_contacto", "—")
+                correo = attrs_contacto.get("correo", "—")
+                cargo = attrs_contacto.get("cargo", "—")
                 
-                st.caption(f"Total de contactos vinculados: {len(contactos)}")
-            else:
-                st.info("💡 Sin contactos asociados aún")
+                estado_contacto = "✅" if c["activo"] else "❌"
+                st.write(f"  {estado_contacto} **{nombre_contacto}** — {cargo} | 📞 {telefono_contacto} | ✉️ {correo}")
+            
+            st.caption(f"Total de contactos vinculados: {len(contactos)}")
+        else:
+            st.info("💡 Sin contactos asociados aún")
         
         # Botones de acción
         col1, col2, col3, col4 = st.columns(4)
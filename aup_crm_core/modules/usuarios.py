@@ -25,8 +25,8 @@ def show():
                 if conn:
                     # Verificar si el correo ya existe
                     cur = conn.cursor()
-                    cur.execute("SELECT * FROM aup_agentes WHERE tipo='usuario' AND atributos LIKE ?", 
-                               (f"%correo={correo}%",))
+                    cur.execute("SELECT 1 FROM aup_agentes WHERE tipo='usuario' AND correo=? LIMIT 1",
+                               (correo,))
                     existe = cur.fetchone()
                     
                     if existe:
@@ -34,9 +34,9 @@ def show():
                     else:
                         password_hash = hash_password(password)
                         cur.execute("""
-                            INSERT INTO aup_agentes (tipo, nombre, atributos, password_hash, activo)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, ("usuario", nombre, f"correo={correo};rol={rol}", password_hash, 1))
+                            INSERT INTO aup_agentes (tipo, nombre, atributos, password, correo, activo)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """, ("usuario", nombre, f"correo={correo};rol={rol}", password_hash, correo, 1))
                         conn.commit()
                         usuario_id = cur.lastrowid
                         conn.close()
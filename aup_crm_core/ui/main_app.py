@@ -48,9 +48,9 @@ def main():
                         cur = conn.cursor()
                         password_hash = hash_password(password)
                         cur.execute("""
-                            INSERT INTO aup_agentes (tipo, nombre, atributos, password, activo)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, ("usuario", nombre, f"correo={correo};rol=Administrador", password_hash, 1))
+                            INSERT INTO aup_agentes (tipo, nombre, atributos, password, correo, activo)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                        """, ("usuario", nombre, f"correo={correo};rol=Administrador", password_hash, correo, 1))
                         conn.commit()
                         conn.close()
                         st.success("✅ Administrador creado! Recarga la página para iniciar sesión.")
@@ -84,6 +84,11 @@ def main():
     
     page = sidebar.show_sidebar()
 
+    # Al entrar a una sección desde otra, el listado de clientes vuelve a su primera página
+    if st.session_state.get("pagina_actual") != page:
+        st.session_state["pagina_actual"] = page
+        clientes.reiniciar_paginacion()
+
     if page == "Dashboard":
         dashboard.show()
     elif page == "Usuarios":
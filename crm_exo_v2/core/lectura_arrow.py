@@ -0,0 +1,56 @@
+# ================================================================
+#  core/lectura_arrow.py  |  CRM-EXO v2
+#  ---------------------------------------------------------------
+#  Lectura columnar opcional de listados (adbc-driver-sqlite + pyarrow).
+#
+#  El resultado se decodifica en columnas Arrow y se entrega como
+#  DataFrame con pd.ArrowDtype, sin un objeto Python por celda.
+#  Si el driver no está instalado, disponible() retorna False y el
+#  llamador usa pd.read_sql.
+# ================================================================
+
+import threading
+from pathlib import Path
+from typing import Sequence
+
+try:
+    import adbc_driver_sqlite.dbapi as adbc_sqlite
+except ImportError:
+    adbc_sqlite = None
+
+
+def disponible() -> bool:
+    """True si adbc-driver-sqlite está instalado."""
+    return adbc_sqlite is not None
+
+
+class LectorArrow:
+    """
+    Conexión ADBC de larga vida para lecturas (una por proceso).
+
+    Las consultas se serializan con un lock: la conexión no admite uso
+    concurrente desde varios hilos. autocommit=True evita que la conexión
+    mantenga abierta una transacción de lectura (y con ella una foto vieja
+    de la base) entre consultas.
+    """
+
+    Error = adbc_sqlite.Error if adbc_sqlite else Exception
+
+    def __init__(self, db_path: Path):
+        if adbc_sqlite is None:
+            raise RuntimeError("adbc-driver-sqlite no está instalado")
+        self._con = adbc_sqlite.connect(str(db_path), autocommit=True)
+        self._lock = threading.Lock()
+
+    def leer(self, sql: str, params: Sequence = ()):
+        """DataFrame (columnas pd.ArrowDtype) con el resultado de la consulta."""
+        import pandas as pd
+
+        with self._lock, self._con.cursor() as cur:
+            cur.execute(sql, params or None)
+            return cur.fetch_arrow_table().to_pandas(types_mapper=pd.ArrowDtype)
+
+    def cerrar(self):
+        """Cierra la conexión ADBC."""
+        with self._lock:
+            self._con.close()
@@ -30,6 +30,31 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 DB_PATH = BASE_DIR / "data" / "crm_exo_v2.sqlite"
 
 
+def crear_conexion(check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Abre una conexión SQLite a DB_PATH con configuración AUP.
+    
+    Args:
+        check_same_thread: False para compartir la conexión entre hilos
+                           (ej: recurso cacheado en Streamlit)
+    
+    Returns:
+        sqlite3.Connection: Conexión configurada con row_factory, FK habilitadas,
+                            WAL y caché de páginas / mmap ampliados para lecturas
+    """
+    con = sqlite3.connect(str(DB_PATH), check_same_thread=check_same_thread)
+    con.row_factory = sqlite3.Row
+    con.executescript("""
+        PRAGMA foreign_keys = ON;
+        PRAGMA journal_mode = WAL;
+        PRAGMA synchronous = NORMAL;
+        PRAGMA cache_size = -65536;
+        PRAGMA mmap_size = 268435456;
+        PRAGMA temp_store = MEMORY;
+    """)
+    return con
+
+
 # ================================================================
 #  CLASE BASE UNIVERSAL
 # ================================================================
@@ -63,11 +88,12 @@ class AUPRepository:
         Args:
             entidad: Nombre de la entidad (empresa, contacto, prospecto, etc.)
             usuario: Usuario que realiza las operaciones (para trazabilidad)
-            conn: Conexión SQLite externa (para testing con DB temporal)
+            conn: Conexión SQLite externa, administrada por quien la inyecta
+                  (DB temporal en tests, conexión por sesión en la UI)
         """
         self.entidad = entidad
         self.usuario = usuario
-        self._external_conn = conn  # Conexión inyectada para tests
+        self._external_conn = conn  # Conexión inyectada (tests o sesión de UI)
         if not conn:  # Solo validar DB_PATH si no hay conexión externa
             self._validate_db_path()
 
@@ -88,28 +114,25 @@ class AUPRepository:
     def conectar(self) -> sqlite3.Connection:
         """
         Establece conexión SQLite con configuración AUP.
-        Soporta inyección de conexión para testing.
+        Soporta inyección de conexión (tests, conexión por sesión de la UI).
         
         Returns:
             sqlite3.Connection: Conexión configurada con row_factory y FK habilitadas
         """
-        # Si existe conexión externa inyectada (testing), usarla
+        # Si existe conexión externa inyectada, usarla
         if hasattr(self, '_external_conn') and self._external_conn:
             return self._external_conn
         
         # Conexión normal a DB de producción
-        con = sqlite3.connect(str(DB_PATH))
-        con.row_factory = sqlite3.Row
-        con.execute("PRAGMA foreign_keys = ON")
-        return con
+        return crear_conexion()
     
     def cerrar_conexion(self, con: sqlite3.Connection):
         """
-        Cierra la conexión solo si NO es externa (inyectada para testing).
-        En testing, la conexión se maneja externamente y no debe cerrarse.
+        Cierra la conexión solo si NO es externa (inyectada).
+        La conexión inyectada la maneja quien la creó y no debe cerrarse aquí.
         """
         if not (hasattr(self, '_external_conn') and self._external_conn):
-            self.cerrar_conexion(con)
+            con.close()
 
     # ------------------------------------------------------------
     # Hash estructurado (SHA-256 JSON)
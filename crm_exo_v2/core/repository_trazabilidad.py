@@ -73,13 +73,14 @@ class HistorialGeneralRepository(AUPRepository):
     # ------------------------------------------------------------
     # Listar últimos eventos
     # ------------------------------------------------------------
-    def listar_eventos(self, limite=25, entidad=None):
+    def listar_eventos(self, limite=25, entidad=None, offset=0):
         """
         Lista los eventos más recientes del sistema.
         
         Args:
             limite: Número máximo de eventos a retornar
             entidad: Filtrar por tabla origen (opcional)
+            offset: Eventos a saltar (paginación)
         
         Returns:
             Lista de eventos ordenados por más reciente
@@ -101,8 +102,8 @@ class HistorialGeneralRepository(AUPRepository):
                 FROM historial_general
                 WHERE entidad = ?
                 ORDER BY id_evento DESC
-                LIMIT ?
-            """, (entidad, limite))
+                LIMIT ? OFFSET ?
+            """, (entidad, limite, offset))
         else:
             cur.execute("""
                 SELECT 
@@ -116,8 +117,8 @@ class HistorialGeneralRepository(AUPRepository):
                     hash_evento
                 FROM historial_general
                 ORDER BY id_evento DESC
-                LIMIT ?
-            """, (limite,))
+                LIMIT ? OFFSET ?
+            """, (limite, offset))
         
         rows = cur.fetchall()
         self.cerrar_conexion(con)
@@ -126,13 +127,14 @@ class HistorialGeneralRepository(AUPRepository):
     # ------------------------------------------------------------
     # Buscar eventos por entidad, usuario o acción
     # ------------------------------------------------------------
-    def buscar(self, texto, limite=50):
+    def buscar(self, texto, limite=50, offset=0):
         """
         Búsqueda flexible en el historial.
         
         Args:
             texto: Texto a buscar en entidad, usuario o acción
             limite: Máximo de resultados
+            offset: Resultados a saltar (paginación)
         
         Returns:
             Lista de eventos que coinciden
@@ -151,8 +153,8 @@ class HistorialGeneralRepository(AUPRepository):
             FROM historial_general
             WHERE entidad LIKE ? OR usuario LIKE ? OR accion LIKE ?
             ORDER BY id_evento DESC
-            LIMIT ?
-        """, (f"%{texto}%", f"%{texto}%", f"%{texto}%", limite))
+            LIMIT ? OFFSET ?
+        """, (f"%{texto}%", f"%{texto}%", f"%{texto}%", limite, offset))
         rows = cur.fetchall()
         self.cerrar_conexion(con)
         return [dict(r) for r in rows]
@@ -399,15 +401,20 @@ class HashRepository(AUPRepository):
                 "mensaje": "No hay suficientes datos para verificar integridad"
             }
 
-        integridad_ok = hash_reg[0] == hash_event[0]
+        return self._resultado_integridad(tabla_origen, id_registro, hash_reg[0], hash_event[0])
+
+    @staticmethod
+    def _resultado_integridad(tabla_origen, id_registro, hash_reg, hash_event):
+        """Arma el resultado de comparar el hash registrado con el del evento."""
+        integridad_ok = hash_reg == hash_event
         
         return {
             "tabla_origen": tabla_origen,
             "id_registro": id_registro,
-            "hash_registro": hash_reg[0][:32] + "...",
-            "hash_evento": hash_event[0][:32] + "...",
-            "hash_completo_registro": hash_reg[0],
-            "hash_completo_evento": hash_event[0],
+            "hash_registro": hash_reg[:32] + "...",
+            "hash_evento": hash_event[:32] + "...",
+            "hash_completo_registro": hash_reg,
+            "hash_completo_evento": hash_event,
             "integridad_ok": integridad_ok,
             "mensaje": "✅ Integridad verificada" if integridad_ok else "❌ ALERTA: Hashes no coinciden"
         }
@@ -459,6 +466,73 @@ class HashRepository(AUPRepository):
         
         return resultados
 
+    # Último hash de cada registro contra el último evento de la misma
+    # entidad, con el estado de la comparación resuelto en SQL
+    _SQL_VERIFICACION = """
+        WITH verificacion AS (
+            SELECT u.tabla_origen, u.id_registro,
+                   hr.hash_sha256 AS hash_registro,
+                   h.hash_evento AS hash_evento,
+                   CASE
+                       WHEN hr.hash_sha256 IS NULL OR h.hash_evento IS NULL THEN 'sin_datos'
+                       WHEN hr.hash_sha256 = h.hash_evento THEN 'ok'
+                       ELSE 'error'
+                   END AS estado
+            FROM (
+                SELECT tabla_origen, id_registro, MAX(id_hash) AS id_hash
+                FROM hash_registros
+                GROUP BY tabla_origen, id_registro
+            ) u
+            JOIN hash_registros hr ON hr.id_hash = u.id_hash
+            LEFT JOIN historial_general h ON h.id_evento = (
+                SELECT MAX(id_evento) FROM historial_general
+                WHERE entidad = u.tabla_origen AND id_entidad = u.id_registro
+            )
+        )
+    """
+
+    def auditoria_completa_sql(self):
+        """
+        Igual que auditoria_completa(), pero resuelve todas las
+        verificaciones cruzadas en SQL: los conteos salen de una
+        agregación y a Python solo llegan los registros con error.
+        
+        Returns:
+            Diccionario con resultados de auditoría
+        """
+        con = self.conectar()
+        cur = con.cursor()
+        
+        cur.execute(self._SQL_VERIFICACION + """
+            SELECT
+                COUNT(*) AS total_verificados,
+                COALESCE(SUM(estado = 'ok'), 0) AS integridad_ok,
+                COALESCE(SUM(estado = 'error'), 0) AS integridad_error,
+                COALESCE(SUM(estado = 'sin_datos'), 0) AS sin_datos
+            FROM verificacion
+        """)
+        resultados = dict(cur.fetchone())
+        
+        cur.execute(self._SQL_VERIFICACION + """
+            SELECT tabla_origen, id_registro, hash_registro, hash_evento
+            FROM verificacion
+            WHERE estado = 'error'
+        """)
+        errores = cur.fetchall()
+        self.cerrar_conexion(con)
+        
+        resultados["detalles"] = [
+            self._resultado_integridad(
+                reg["tabla_origen"],
+                reg["id_registro"],
+                reg["hash_registro"],
+                reg["hash_evento"]
+            )
+            for reg in errores
+        ]
+        
+        return resultados
+
     # ------------------------------------------------------------
     # Estadísticas de hashes
     # ------------------------------------------------------------
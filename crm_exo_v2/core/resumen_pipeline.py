@@ -0,0 +1,107 @@
+# ================================================================
+#  core/resumen_pipeline.py  |  CRM-EXO v2
+#  ---------------------------------------------------------------
+#  Resumen por empresa del Pipeline Visual mantenido por triggers.
+#
+#  Cada escritura en empresas/contactos/prospectos/oportunidades
+#  recalcula solo la fila de su empresa (vía v_resumen_pipeline), y
+#  la página lee la tabla ya agregada. Los conteos y monto_ganado
+#  salen de subconsultas por empresa: un JOIN de las cuatro tablas
+#  multiplicaba el monto por el número de contactos.
+# ================================================================
+
+RESUMEN_PIPELINE = """
+    CREATE TABLE IF NOT EXISTS resumen_pipeline (
+        id_empresa INTEGER PRIMARY KEY,
+        empresa TEXT,
+        contactos INTEGER,
+        prospectos INTEGER,
+        prospectos_activos INTEGER,
+        clientes INTEGER,
+        oportunidades INTEGER,
+        ganadas INTEGER,
+        monto_ganado REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_resumen_pipeline_orden ON resumen_pipeline(monto_ganado DESC, oportunidades DESC);
+
+    CREATE VIEW IF NOT EXISTS v_resumen_pipeline AS
+    SELECT
+        e.id_empresa,
+        e.nombre AS empresa,
+        (SELECT COUNT(*) FROM contactos c WHERE c.id_empresa = e.id_empresa) AS contactos,
+        (SELECT COUNT(*) FROM prospectos p WHERE p.id_empresa = e.id_empresa) AS prospectos,
+        (SELECT COUNT(*) FROM prospectos p WHERE p.id_empresa = e.id_empresa AND p.es_cliente = 0) AS prospectos_activos,
+        (SELECT COUNT(*) FROM prospectos p WHERE p.id_empresa = e.id_empresa AND p.es_cliente = 1) AS clientes,
+        (SELECT COUNT(*) FROM oportunidades o JOIN prospectos p ON p.id_prospecto = o.id_prospecto
+         WHERE p.id_empresa = e.id_empresa) AS oportunidades,
+        (SELECT COUNT(*) FROM oportunidades o JOIN prospectos p ON p.id_prospecto = o.id_prospecto
+         WHERE p.id_empresa = e.id_empresa AND o.etapa = 'Ganada') AS ganadas,
+        (SELECT ROUND(COALESCE(SUM(o.monto_estimado), 0), 2) FROM oportunidades o JOIN prospectos p ON p.id_prospecto = o.id_prospecto
+         WHERE p.id_empresa = e.id_empresa AND o.etapa = 'Ganada') AS monto_ganado
+    FROM empresas e;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_empresa_ins AFTER INSERT ON empresas
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = NEW.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_empresa_upd AFTER UPDATE OF nombre ON empresas
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = NEW.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_empresa_del AFTER DELETE ON empresas
+    BEGIN
+        DELETE FROM resumen_pipeline WHERE id_empresa = OLD.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_contacto_ins AFTER INSERT ON contactos
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = NEW.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_contacto_upd AFTER UPDATE OF id_empresa ON contactos
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = OLD.id_empresa;
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = NEW.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_contacto_del AFTER DELETE ON contactos
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = OLD.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_prospecto_ins AFTER INSERT ON prospectos
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = NEW.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_prospecto_upd AFTER UPDATE OF id_empresa, es_cliente ON prospectos
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = OLD.id_empresa;
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = NEW.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_prospecto_del AFTER DELETE ON prospectos
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = OLD.id_empresa;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_oportunidad_ins AFTER INSERT ON oportunidades
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = (SELECT id_empresa FROM prospectos WHERE id_prospecto = NEW.id_prospecto);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_oportunidad_upd AFTER UPDATE OF id_prospecto, etapa, monto_estimado ON oportunidades
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = (SELECT id_empresa FROM prospectos WHERE id_prospecto = OLD.id_prospecto);
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = (SELECT id_empresa FROM prospectos WHERE id_prospecto = NEW.id_prospecto);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS trg_resumen_oportunidad_del AFTER DELETE ON oportunidades
+    BEGIN
+        INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline WHERE id_empresa = (SELECT id_empresa FROM prospectos WHERE id_prospecto = OLD.id_prospecto);
+    END;
+
+    INSERT OR REPLACE INTO resumen_pipeline SELECT * FROM v_resumen_pipeline;
+"""
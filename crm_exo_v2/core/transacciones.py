@@ -0,0 +1,35 @@
+# ================================================================
+#  core/transacciones.py  |  CRM-EXO v2
+#  ---------------------------------------------------------------
+#  Transacción de escritura para las conexiones de la UI.
+#
+#  BEGIN IMMEDIATE toma el lock de escritura al inicio en vez de
+#  escalar de DEFERRED a mitad de la transacción (SQLITE_BUSY con
+#  otras sesiones leyendo). Sólo confirma o revierte la transacción
+#  que abrió: anidada, o con una transacción ya abierta, la decisión
+#  queda en manos de quien la inició.
+# ================================================================
+
+import sqlite3
+from contextlib import contextmanager
+
+
+@contextmanager
+def transaccion_escritura(con: sqlite3.Connection):
+    """
+    Transacción de escritura con BEGIN IMMEDIATE.
+
+    Commit al salir y rollback si hay excepción, sólo cuando la transacción
+    es propia (la conexión no estaba ya en una transacción).
+    """
+    propia = not con.in_transaction
+    if propia:
+        con.execute("BEGIN IMMEDIATE")
+    try:
+        yield con
+    except Exception:
+        if propia:
+            con.rollback()
+        raise
+    if propia:
+        con.commit()
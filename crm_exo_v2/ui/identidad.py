@@ -212,15 +212,15 @@ with tab1:
     col1, col2, col3 = st.columns(3)
     
     with col1:
-        total_empresas = pd.read_sql("SELECT COUNT(*) as total FROM empresas", con).iloc[0]["total"]
+        total_empresas = con.execute("SELECT COUNT(*) FROM empresas").fetchone()[0]
         st.metric("Empresas Registradas", total_empresas)
     
     with col2:
-        total_contactos = pd.read_sql("SELECT COUNT(*) as total FROM contactos", con).iloc[0]["total"]
+        total_contactos = con.execute("SELECT COUNT(*) FROM contactos").fetchone()[0]
         st.metric("Contactos", total_contactos)
     
     with col3:
-        total_prospectos = pd.read_sql("SELECT COUNT(*) as total FROM prospectos WHERE estado='Activo'", con).iloc[0]["total"]
+        total_prospectos = con.execute("SELECT COUNT(*) FROM prospectos WHERE estado='Activo'").fetchone()[0]
         st.metric("Prospectos Activos", total_prospectos)
     
     st.divider()
@@ -299,13 +299,14 @@ with tab2:
                         st.error(f"❌ Ya existe una empresa con el nombre '{nombre}'. Por favor usa un nombre diferente.")
                         con.close()
                     else:
-                        cur.execute("""
-                            INSERT INTO empresas (nombre, rfc, sector, telefono, correo)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, (nombre, rfc or None, sector or None, telefono or None, correo or None))
-                        con.commit()
-                        id_emp = cur.lastrowid
-                        h = registrar_evento(con, "empresa", id_emp, "CREAR", f"Empresa: {nombre}")
+                        # Escritura y evento en una transacción: commit único, rollback si falla
+                        with con:
+                            cur.execute("""
+                                INSERT INTO empresas (nombre, rfc, sector, telefono, correo)
+                                VALUES (?, ?, ?, ?, ?)
+                            """, (nombre, rfc or None, sector or None, telefono or None, correo or None))
+                            id_emp = cur.lastrowid
+                            h = registrar_evento(con, "empresa", id_emp, "CREAR", f"Empresa: {nombre}")
                         con.close()
                         st.success(f"✅ Empresa '{nombre}' registrada correctamente")
                         st.caption(f"🔐 Hash forense: {h[:16]}...")
@@ -350,15 +351,15 @@ with tab2:
                             st.error(f"❌ Ya existe otra empresa con el nombre '{nombre_edit}'.")
                             con.close()
                         else:
-                            cur.execute("""
-                                UPDATE empresas 
-                                SET nombre = ?, rfc = ?, sector = ?, telefono = ?, correo = ?
-                                WHERE id_empresa = ?
-                            """, (nombre_edit, rfc_edit or None, sector_edit or None, 
-                                  telefono_edit or None, correo_edit or None, int(empresa_data["id_empresa"])))
-                            con.commit()
-                            h = registrar_evento(con, "empresa", int(empresa_data["id_empresa"]), 
-                                               "ACTUALIZAR", f"Empresa actualizada: {nombre_edit}")
+                            with con:
+                                cur.execute("""
+                                    UPDATE empresas 
+                                    SET nombre = ?, rfc = ?, sector = ?, telefono = ?, correo = ?
+                                    WHERE id_empresa = ?
+                                """, (nombre_edit, rfc_edit or None, sector_edit or None, 
+                                      telefono_edit or None, correo_edit or None, int(empresa_data["id_empresa"])))
+                                h = registrar_evento(con, "empresa", int(empresa_data["id_empresa"]), 
+                                                   "ACTUALIZAR", f"Empresa actualizada: {nombre_edit}")
                             con.close()
                             st.success(f"✅ Empresa '{nombre_edit}' actualizada correctamente")
                             st.caption(f"🔐 Hash forense: {h[:16]}...")
@@ -430,13 +431,13 @@ with tab3:
                     else:
                         con = conectar()
                         cur = con.cursor()
-                        cur.execute("""
-                            INSERT INTO contactos (id_empresa, nombre, correo, telefono, puesto)
-                            VALUES (?, ?, ?, ?, ?)
-                        """, (id_empresa, nombre_c, correo_c, telefono_c or None, puesto_c or None))
-                        con.commit()
-                        id_con = cur.lastrowid
-                        h = registrar_evento(con, "contacto", id_con, "CREAR", f"Contacto: {nombre_c} en {empresa_sel}")
+                        with con:
+                            cur.execute("""
+                                INSERT INTO contactos (id_empresa, nombre, correo, telefono, puesto)
+                                VALUES (?, ?, ?, ?, ?)
+                            """, (id_empresa, nombre_c, correo_c, telefono_c or None, puesto_c or None))
+                            id_con = cur.lastrowid
+                            h = registrar_evento(con, "contacto", id_con, "CREAR", f"Contacto: {nombre_c} en {empresa_sel}")
                         con.close()
                         st.success(f"✅ Contacto '{nombre_c}' registrado correctamente")
                         st.caption(f"🔐 Hash forense: {h[:16]}...")
@@ -458,11 +459,13 @@ with tab3:
                 if len(contactos_edit) == 0:
                     st.info("No hay contactos para editar.")
                 else:
-                    contacto_sel = st.selectbox(
+                    # Etiquetas "nombre (empresa)" con operaciones de columna, sin apply por fila
+                    etiquetas_edit = (contactos_edit["nombre"] + " (" + contactos_edit["empresa"] + ")").tolist()
+                    idx = st.selectbox(
                         "Selecciona contacto a editar",
-                        contactos_edit.apply(lambda x: f"{x['nombre']} ({x['empresa']})", axis=1).tolist()
+                        range(len(etiquetas_edit)),
+                        format_func=etiquetas_edit.__getitem__
                     )
-                    idx = contactos_edit.apply(lambda x: f"{x['nombre']} ({x['empresa']})", axis=1).tolist().index(contacto_sel)
                     contacto_data = contactos_edit.iloc[idx]
                     
                     with st.form("editar_contacto"):
@@ -481,15 +484,15 @@ with tab3:
                         else:
                             con = conectar()
                             cur = con.cursor()
-                            cur.execute("""
-                                UPDATE contactos 
-                                SET id_empresa = ?, nombre = ?, correo = ?, telefono = ?, puesto = ?
-                                WHERE id_contacto = ?
-                            """, (id_empresa_edit, nombre_edit, correo_edit, telefono_edit or None, 
-                                  puesto_edit or None, int(contacto_data["id_contacto"])))
-                            con.commit()
-                            h = registrar_evento(con, "contacto", int(contacto_data["id_contacto"]), 
-                                               "ACTUALIZAR", f"Contacto actualizado: {nombre_edit}")
+                            with con:
+                                cur.execute("""
+                                    UPDATE contactos 
+                                    SET id_empresa = ?, nombre = ?, correo = ?, telefono = ?, puesto = ?
+                                    WHERE id_contacto = ?
+                                """, (id_empresa_edit, nombre_edit, correo_edit, telefono_edit or None, 
+                                      puesto_edit or None, int(contacto_data["id_contacto"])))
+                                h = registrar_evento(con, "contacto", int(contacto_data["id_contacto"]), 
+                                                   "ACTUALIZAR", f"Contacto actualizado: {nombre_edit}")
                             con.close()
                             st.success(f"✅ Contacto '{nombre_edit}' actualizado correctamente")
                             st.caption(f"🔐 Hash forense: {h[:16]}...")
@@ -522,17 +525,16 @@ with tab4:
     st.info("🔒 **REGLA R1:** Solo se pueden generar prospectos desde empresas que tengan al menos un contacto registrado.")
     
     con = conectar()
-    empresas_disp = pd.read_sql("""
-        SELECT e.id_empresa, e.nombre AS empresa, COUNT(c.id_contacto) as total_contactos
+    # nombre -> id_empresa, solo empresas con al menos un contacto
+    empresas_disp = {r["nombre"]: r["id_empresa"] for r in con.execute("""
+        SELECT e.id_empresa, e.nombre
         FROM empresas e
-        INNER JOIN contactos c ON c.id_empresa = e.id_empresa
-        GROUP BY e.id_empresa
-        HAVING COUNT(c.id_contacto) > 0
+        WHERE EXISTS (SELECT 1 FROM contactos c WHERE c.id_empresa = e.id_empresa)
         ORDER BY e.nombre
-    """, con)
+    """).fetchall()}
     con.close()
     
-    if len(empresas_disp) == 0:
+    if not empresas_disp:
         st.warning("⚠️ No hay empresas con contactos válidos. Primero registra empresas y sus contactos.")
     else:
         col_form, col_list = st.columns([1, 1])
@@ -543,10 +545,10 @@ with tab4:
             with st.form("alta_prospecto"):
                 emp_sel = st.selectbox(
                     "Empresa *", 
-                    empresas_disp["empresa"].tolist(),
+                    list(empresas_disp),
                     help="Solo se muestran empresas con contactos registrados (REGLA R1)"
                 )
-                id_empresa = int(empresas_disp.loc[empresas_disp["empresa"] == emp_sel, "id_empresa"].iloc[0])
+                id_empresa = empresas_disp[emp_sel]
                 
                 # Cargar contactos de la empresa seleccionada
                 con = conectar()
@@ -557,9 +559,10 @@ with tab4:
                 
                 if len(contactos_disp) > 0:
                     # Mostrar info del contacto con nombre y puesto
-                    contactos_display = contactos_disp.apply(
-                        lambda x: f"{x['nombre']} ({x['puesto']})" if x['puesto'] else x['nombre'], 
-                        axis=1
+                    con_puesto = contactos_disp["puesto"].fillna("") != ""
+                    contactos_display = contactos_disp["nombre"].where(
+                        ~con_puesto,
+                        contactos_disp["nombre"] + " (" + contactos_disp["puesto"] + ")"
                     ).tolist()
                     
                     cont_sel_idx = st.selectbox("Contacto principal *", range(len(contactos_display)), 
@@ -575,14 +578,14 @@ with tab4:
                     if submitted_pros:
                         con = conectar()
                         cur = con.cursor()
-                        cur.execute("""
-                            INSERT INTO prospectos (id_empresa, id_contacto, origen, estado)
-                            VALUES (?, ?, ?, 'Activo')
-                        """, (id_empresa, id_contacto, origen or "Sin especificar"))
-                        con.commit()
-                        id_pros = cur.lastrowid
-                        h = registrar_evento(con, "prospecto", id_pros, "CREAR", 
-                                           f"Prospecto: {emp_sel} (origen: {origen or 'N/A'})")
+                        with con:
+                            cur.execute("""
+                                INSERT INTO prospectos (id_empresa, id_contacto, origen, estado)
+                                VALUES (?, ?, ?, 'Activo')
+                            """, (id_empresa, id_contacto, origen or "Sin especificar"))
+                            id_pros = cur.lastrowid
+                            h = registrar_evento(con, "prospecto", id_pros, "CREAR", 
+                                               f"Prospecto: {emp_sel} (origen: {origen or 'N/A'})")
                         con.close()
                         st.success(f"✅ Prospecto generado correctamente (ID: {id_pros})")
                         st.caption(f"🔐 Hash forense: {h[:16]}...")
@@ -5,16 +5,13 @@ Script CLI para inicializar el CRM AUP
 """
 
 import sys
-import hashlib
 from pathlib import Path
 
 # Agregar aup_crm_core al path
 sys.path.insert(0, str(Path(__file__).parent / "aup_crm_core"))
 
 from core.database import init_db, get_connection, borrar_db
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+from core.seguridad import hash_password
 
 def crear_admin(nombre="Administrador", correo="admin@synappssys.com", password="admin123"):
     """Crea el usuario administrador inicial"""
@@ -39,9 +36,9 @@ def crear_admin(nombre="Administrador", correo="admin@synappssys.com", password=
     # Crear admin
     password_hash = hash_password(password)
     cur.execute("""
-        INSERT INTO aup_agentes (tipo, nombre, atributos, password, activo)
-        VALUES (?, ?, ?, ?, ?)
-    """, ("usuario", nombre, f"correo={correo};rol=Administrador", password_hash, 1))
+        INSERT INTO aup_agentes (tipo, nombre, atributos, password, correo, activo)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, ("usuario", nombre, f"correo={correo};rol=Administrador", password_hash, correo, 1))
     
     conn.commit()
     admin_id = cur.lastrowid
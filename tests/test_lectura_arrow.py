@@ -0,0 +1,90 @@
+"""
+Tests para la lectura columnar opcional (core/lectura_arrow.py)
+Autor: AUP
+Descripción: Los DataFrames con pd.ArrowDtype que entrega ADBC deben
+coincidir con pd.read_sql y servir a sus consumidores (filtros de texto,
+agregados numéricos, gráficas). Se omiten si adbc-driver-sqlite no está instalado.
+"""
+
+import sqlite3
+
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pyarrow")
+pytest.importorskip("adbc_driver_sqlite.dbapi")
+
+from crm_exo_v2.core.lectura_arrow import LectorArrow, disponible
+
+
+SQL_LISTADO = "SELECT id_empresa, nombre, sector, monto FROM empresas ORDER BY id_empresa"
+
+
+@pytest.fixture
+def db_listado(tmp_path):
+    """Base temporal con un listado pequeño (texto, enteros, reales y NULL)."""
+    db_path = tmp_path / "listado.sqlite"
+    con = sqlite3.connect(str(db_path))
+    con.execute("CREATE TABLE empresas (id_empresa INTEGER PRIMARY KEY, nombre TEXT, sector TEXT, monto REAL)")
+    con.executemany(
+        "INSERT INTO empresas (nombre, sector, monto) VALUES (?, ?, ?)",
+        [("ACME", "Tecnología", 1500.5), ("Beta", None, 20.0), ("Gama Tec", "Tecnología", 0.0)],
+    )
+    con.commit()
+    con.close()
+    return db_path
+
+
+@pytest.fixture
+def lector(db_listado):
+    lector = LectorArrow(db_listado)
+    yield lector
+    lector.cerrar()
+
+
+def test_disponible():
+    assert disponible()
+
+
+def test_lectura_coincide_con_read_sql(lector, db_listado):
+    df_arrow = lector.leer(SQL_LISTADO)
+    con = sqlite3.connect(str(db_listado))
+    df_sql = pd.read_sql(SQL_LISTADO, con)
+    con.close()
+
+    assert all(isinstance(dtype, pd.ArrowDtype) for dtype in df_arrow.dtypes)
+    assert list(df_arrow.columns) == list(df_sql.columns)
+    assert df_arrow.astype(object).where(df_arrow.notna(), None).values.tolist() == \
+        df_sql.astype(object).where(df_sql.notna(), None).values.tolist()
+
+
+def test_lectura_con_parametros(lector):
+    df = lector.leer("SELECT nombre FROM empresas WHERE monto > ?", (10,))
+    assert df["nombre"].tolist() == ["ACME", "Beta"]
+
+
+def test_consumidores_de_listados(lector):
+    df = lector.leer(SQL_LISTADO)
+
+    # Búsqueda de texto como en los filtros de los listados
+    assert df[df["nombre"].str.contains("tec", case=False)]["nombre"].tolist() == ["Gama Tec"]
+    # Agregados numéricos de las métricas
+    assert float(df["monto"].sum()) == pytest.approx(1520.5)
+    assert df.groupby("sector")["monto"].sum().to_dict() == {"Tecnología": 1500.5}
+
+
+def test_grafica_plotly(lector):
+    px = pytest.importorskip("plotly.express")
+    df = lector.leer(SQL_LISTADO)
+    fig = px.bar(df, x="nombre", y="monto")
+    assert list(fig.data[0].x) == ["ACME", "Beta", "Gama Tec"]
+
+
+def test_lecturas_ven_escrituras_posteriores(lector, db_listado):
+    """autocommit: la conexión de larga vida no se queda con una foto vieja."""
+    assert len(lector.leer(SQL_LISTADO)) == 3
+    con = sqlite3.connect(str(db_listado))
+    con.execute("INSERT INTO empresas (nombre, sector, monto) VALUES ('Delta', 'Retail', 5)")
+    con.commit()
+    con.close()
+    assert len(lector.leer(SQL_LISTADO)) == 4
@@ -0,0 +1,163 @@
+"""
+Tests para el resumen del Pipeline Visual (core/resumen_pipeline.py)
+Autor: AUP
+Descripción: La tabla resumen_pipeline, mantenida por triggers, debe
+coincidir con v_resumen_pipeline después de cada escritura en empresas,
+contactos, prospectos y oportunidades.
+"""
+
+import sqlite3
+
+import pytest
+
+from crm_exo_v2.core.resumen_pipeline import RESUMEN_PIPELINE
+
+
+ESQUEMA = """
+    CREATE TABLE empresas (
+        id_empresa INTEGER PRIMARY KEY AUTOINCREMENT,
+        nombre TEXT NOT NULL COLLATE NOCASE
+    );
+    CREATE TABLE contactos (
+        id_contacto INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_empresa INTEGER NOT NULL REFERENCES empresas(id_empresa),
+        nombre TEXT NOT NULL
+    );
+    CREATE TABLE prospectos (
+        id_prospecto INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_empresa INTEGER NOT NULL REFERENCES empresas(id_empresa),
+        id_contacto INTEGER NOT NULL REFERENCES contactos(id_contacto),
+        es_cliente INTEGER DEFAULT 0
+    );
+    CREATE TABLE oportunidades (
+        id_oportunidad INTEGER PRIMARY KEY AUTOINCREMENT,
+        id_prospecto INTEGER NOT NULL REFERENCES prospectos(id_prospecto),
+        etapa TEXT DEFAULT 'Calificación',
+        monto_estimado REAL
+    );
+"""
+
+
+@pytest.fixture
+def con(tmp_path):
+    """Base temporal con las cuatro tablas del pipeline y el resumen instalado."""
+    con = sqlite3.connect(str(tmp_path / "pipeline.sqlite"))
+    con.execute("PRAGMA foreign_keys = ON")
+    con.executescript(ESQUEMA)
+    con.executescript(RESUMEN_PIPELINE)
+    yield con
+    con.close()
+
+
+def resumen(con):
+    return con.execute("SELECT * FROM resumen_pipeline ORDER BY id_empresa").fetchall()
+
+
+def vista(con):
+    return con.execute("SELECT * FROM v_resumen_pipeline ORDER BY id_empresa").fetchall()
+
+
+def assert_sincronizado(con):
+    assert resumen(con) == vista(con)
+
+
+def fila(con, id_empresa):
+    return con.execute("SELECT * FROM resumen_pipeline WHERE id_empresa = ?", (id_empresa,)).fetchone()
+
+
+def test_carga_inicial_de_datos_existentes(tmp_path):
+    """Sobre una base con datos previos, el script llena la tabla desde la vista."""
+    con = sqlite3.connect(str(tmp_path / "previa.sqlite"))
+    con.executescript(ESQUEMA)
+    con.execute("INSERT INTO empresas (nombre) VALUES ('ACME')")
+    con.execute("INSERT INTO contactos (id_empresa, nombre) VALUES (1, 'Ana')")
+    con.execute("INSERT INTO prospectos (id_empresa, id_contacto) VALUES (1, 1)")
+    con.execute("INSERT INTO oportunidades (id_prospecto, etapa, monto_estimado) VALUES (1, 'Ganada', 10)")
+    con.executescript(RESUMEN_PIPELINE)
+    assert_sincronizado(con)
+    assert fila(con, 1) == (1, "ACME", 1, 1, 1, 0, 1, 1, 10.0)
+    # Reaplicar el script (migraciones) no duplica ni altera filas
+    con.executescript(RESUMEN_PIPELINE)
+    assert_sincronizado(con)
+    con.close()
+
+
+def test_resumen_sigue_a_la_vista(con):
+    # Empresas
+    con.execute("INSERT INTO empresas (nombre) VALUES ('ACME')")
+    con.execute("INSERT INTO empresas (nombre) VALUES ('Beta')")
+    assert_sincronizado(con)
+    assert fila(con, 2) == (2, "Beta", 0, 0, 0, 0, 0, 0, 0.0)
+
+    con.execute("UPDATE empresas SET nombre = 'ACME SA' WHERE id_empresa = 1")
+    assert_sincronizado(con)
+
+    # Contactos: varios por empresa (antes multiplicaban monto_ganado)
+    con.executemany("INSERT INTO contactos (id_empresa, nombre) VALUES (?, ?)",
+                    [(1, "Ana"), (1, "Luis"), (1, "Eva"), (2, "Beto")])
+    assert_sincronizado(con)
+
+    # Prospectos
+    con.execute("INSERT INTO prospectos (id_empresa, id_contacto) VALUES (1, 1)")
+    con.execute("INSERT INTO prospectos (id_empresa, id_contacto) VALUES (1, 2)")
+    con.execute("INSERT INTO prospectos (id_empresa, id_contacto) VALUES (2, 4)")
+    assert_sincronizado(con)
+
+    con.execute("UPDATE prospectos SET es_cliente = 1 WHERE id_prospecto = 2")
+    assert_sincronizado(con)
+
+    # Oportunidades
+    con.executemany("INSERT INTO oportunidades (id_prospecto, etapa, monto_estimado) VALUES (?, ?, ?)",
+                    [(1, "Ganada", 1000.0), (1, "Calificación", 500.0), (2, "Ganada", 250.5), (3, "Ganada", 80.0)])
+    assert_sincronizado(con)
+    # Sin fan-out: 3 contactos no triplican el monto
+    assert fila(con, 1) == (1, "ACME SA", 3, 2, 1, 1, 3, 2, 1250.5)
+
+    con.execute("UPDATE oportunidades SET etapa = 'Ganada' WHERE id_oportunidad = 2")
+    assert_sincronizado(con)
+    con.execute("UPDATE oportunidades SET monto_estimado = 600 WHERE id_oportunidad = 2")
+    assert_sincronizado(con)
+    assert fila(con, 1)[-1] == 1850.5
+
+    # Mover una oportunidad a un prospecto de otra empresa
+    con.execute("UPDATE oportunidades SET id_prospecto = 3 WHERE id_oportunidad = 1")
+    assert_sincronizado(con)
+    assert fila(con, 1)[-1] == 850.5
+    assert fila(con, 2)[-1] == 1080.0
+
+    # Mover un prospecto (con sus oportunidades) a otra empresa
+    con.execute("UPDATE prospectos SET id_empresa = 2 WHERE id_prospecto = 2")
+    assert_sincronizado(con)
+    assert fila(con, 1)[3:] == (1, 1, 0, 1, 1, 600.0)
+
+    # Mover un contacto a otra empresa
+    con.execute("UPDATE contactos SET id_empresa = 2 WHERE id_contacto = 3")
+    assert_sincronizado(con)
+    assert fila(con, 1)[2] == 2
+
+    # Borrados
+    con.execute("DELETE FROM oportunidades WHERE id_oportunidad = 3")
+    assert_sincronizado(con)
+    con.execute("DELETE FROM oportunidades WHERE id_prospecto = 1")
+    con.execute("DELETE FROM prospectos WHERE id_prospecto = 1")
+    assert_sincronizado(con)
+    con.execute("DELETE FROM contactos WHERE id_contacto = 1")
+    assert_sincronizado(con)
+    # Luis sigue el prospecto que ya se movió a Beta
+    con.execute("UPDATE contactos SET id_empresa = 2 WHERE id_contacto = 2")
+    assert_sincronizado(con)
+    assert fila(con, 1) == (1, "ACME SA", 0, 0, 0, 0, 0, 0, 0.0)
+
+    con.execute("DELETE FROM empresas WHERE id_empresa = 1")
+    assert_sincronizado(con)
+    assert fila(con, 1) is None
+
+
+def test_rollback_deshace_el_resumen(con):
+    """Los triggers corren en la misma transacción que la escritura."""
+    con.execute("INSERT INTO empresas (nombre) VALUES ('ACME')")
+    con.commit()
+    con.execute("INSERT INTO contactos (id_empresa, nombre) VALUES (1, 'Ana')")
+    con.rollback()
+    assert_sincronizado(con)
+    assert fila(con, 1)[2] == 0
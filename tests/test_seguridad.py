@@ -0,0 +1,92 @@
+"""
+Tests para el hash de contraseñas (aup_crm_core/core/seguridad.py) y la
+migración de hashes heredados al iniciar sesión (modules/auth.py)
+Autor: AUP
+Descripción: scrypt con sal por usuario, compatibilidad con sha256 heredado
+y rehash a scrypt en verificar_credenciales.
+"""
+
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from aup_crm_core.core.seguridad import (
+    PREFIJO_SCRYPT, hash_password, requiere_rehash, verificar_password,
+)
+
+AUP_DIR = Path(__file__).resolve().parent.parent / "aup_crm_core"
+
+
+def test_hash_password_ida_y_vuelta():
+    almacenado = hash_password("s3creta")
+    assert almacenado.startswith(PREFIJO_SCRYPT + "$")
+    assert verificar_password("s3creta", almacenado)
+    assert not requiere_rehash(almacenado)
+
+
+def test_sal_distinta_por_hash():
+    assert hash_password("s3creta") != hash_password("s3creta")
+
+
+def test_password_incorrecta_se_rechaza():
+    assert not verificar_password("otra", hash_password("s3creta"))
+
+
+@pytest.mark.parametrize("almacenado", [
+    "scrypt$",
+    "scrypt$zz$00",
+    "scrypt$abcd",
+    "scrypt$ab$cd$ef",
+    "",
+    None,
+])
+def test_valor_malformado_retorna_false(almacenado):
+    assert verificar_password("s3creta", almacenado) is False
+
+
+def test_hash_heredado_sha256():
+    heredado = hashlib.sha256("s3creta".encode()).hexdigest()
+    assert verificar_password("s3creta", heredado)
+    assert not verificar_password("otra", heredado)
+    assert requiere_rehash(heredado)
+
+
+@pytest.fixture
+def auth_db(tmp_path, monkeypatch):
+    """modules.auth sobre una base AUP temporal (requiere streamlit)."""
+    pytest.importorskip("streamlit")
+    monkeypatch.syspath_prepend(str(AUP_DIR))
+    import core.database as database
+    from modules import auth
+
+    monkeypatch.setattr(database, "DB_PATH", tmp_path / "aup.sqlite")
+    monkeypatch.setattr(database, "_shared_conn", None)
+    monkeypatch.setattr(database, "_pool_lectura", None)
+    monkeypatch.setattr(database, "_esquema_preparado", False)
+    database.init_db()
+    yield database, auth
+    database._cerrar_shared_connection()
+
+
+def test_verificar_credenciales_migra_hash_heredado(auth_db):
+    database, auth = auth_db
+    heredado = hashlib.sha256("s3creta".encode()).hexdigest()
+    conn = database.get_shared_connection()
+    conn.execute(
+        "INSERT INTO aup_agentes (tipo, nombre, atributos, password, correo, activo) VALUES (?, ?, ?, ?, ?, 1)",
+        ("usuario", "Ana", "correo=ana@x.com;rol=Administrador", heredado, "ana@x.com"),
+    )
+    conn.commit()
+
+    assert auth.verificar_credenciales("ana@x.com", "otra") is None
+
+    usuario = auth.verificar_credenciales("ana@x.com", "s3creta")
+    assert usuario is not None and usuario["nombre"] == "Ana"
+
+    almacenado = conn.execute("SELECT password FROM aup_agentes WHERE correo='ana@x.com'").fetchone()[0]
+    assert almacenado.startswith(PREFIJO_SCRYPT + "$")
+    assert verificar_password("s3creta", almacenado)
+
+    # El siguiente login ya valida contra el hash scrypt
+    assert auth.verificar_credenciales("ana@x.com", "s3creta") is not None
@@ -0,0 +1,61 @@
+"""
+Tests para sql_atributo (aup_crm_core/core/database.py)
+Autor: AUP
+Descripción: La extracción en SQL de "clave=valor;..." debe coincidir con
+parse_atributos en el formato que escriben los módulos; las dos diferencias
+documentadas (clave repetida, espacios en la clave) quedan fijadas aquí.
+"""
+
+import sqlite3
+
+import pytest
+
+from aup_crm_core.core.database import sql_atributo
+from aup_crm_core.core.ui_utils import parse_atributos
+
+
+@pytest.fixture
+def extraer():
+    con = sqlite3.connect(":memory:")
+
+    def _extraer(atributos, clave):
+        sql = f"SELECT {sql_atributo('t.atributos', clave)} FROM (SELECT ? AS atributos) t"
+        return con.execute(sql, (atributos,)).fetchone()[0]
+
+    yield _extraer
+    con.close()
+
+
+@pytest.mark.parametrize("atributos", [
+    "estado=Ganada;monto=1500.5",
+    "monto=20;estado=Abierta",
+    "estado=Ganada",
+    "monto=;estado=Ganada",
+    "no_estado=Perdida;estado=Ganada;estados=X",
+    "estado_final=Ganada",
+    "montos=1;monto=—",
+    "sector=Tecnología;telefono_empresa=55 1234;estado=Cerrado;vigencia=2025-12-31",
+    "",
+    None,
+])
+@pytest.mark.parametrize("clave", ["estado", "monto"])
+def test_coincide_con_parse_atributos(extraer, atributos, clave):
+    assert extraer(atributos, clave) == parse_atributos(atributos).get(clave)
+
+
+def test_clave_repetida_toma_la_primera(extraer):
+    atributos = "estado=Abierta;estado=Ganada"
+    assert extraer(atributos, "estado") == "Abierta"
+    assert parse_atributos(atributos).get("estado") == "Ganada"
+
+
+def test_clave_con_espacios_no_se_encuentra(extraer):
+    atributos = "monto=10; estado=Ganada"
+    assert extraer(atributos, "estado") is None
+    assert parse_atributos(atributos).get("estado") == "Ganada"
+
+
+@pytest.mark.parametrize("columna, clave", [("atributos; DROP", "estado"), ("atributos", "estado'--")])
+def test_rechaza_identificadores_no_validos(columna, clave):
+    with pytest.raises(ValueError):
+        sql_atributo(columna, clave)
@@ -0,0 +1,92 @@
+"""
+Tests para transaccion_escritura (core/transacciones.py)
+Autor: AUP
+Descripción: Sólo la transacción propia se confirma o revierte; anidada o con
+una transacción ya abierta, la decisión queda en quien la inició.
+"""
+
+import sqlite3
+
+import pytest
+
+from crm_exo_v2.core.transacciones import transaccion_escritura
+
+
+@pytest.fixture
+def con(tmp_path):
+    con = sqlite3.connect(str(tmp_path / "tx.sqlite"))
+    con.execute("CREATE TABLE t (v INTEGER)")
+    con.commit()
+    yield con
+    con.close()
+
+
+def valores(con):
+    return [fila[0] for fila in con.execute("SELECT v FROM t ORDER BY v")]
+
+
+def test_commit_al_salir(con):
+    with transaccion_escritura(con):
+        con.execute("INSERT INTO t VALUES (1)")
+    assert not con.in_transaction
+    assert valores(con) == [1]
+
+
+def test_rollback_con_excepcion(con):
+    with pytest.raises(ValueError):
+        with transaccion_escritura(con):
+            con.execute("INSERT INTO t VALUES (1)")
+            raise ValueError("falla")
+    assert not con.in_transaction
+    assert valores(con) == []
+
+
+def test_bloques_anidados_confirma_solo_el_externo(con):
+    with transaccion_escritura(con):
+        con.execute("INSERT INTO t VALUES (1)")
+        with transaccion_escritura(con):
+            con.execute("INSERT INTO t VALUES (2)")
+        # El bloque interno no confirmó la transacción del externo
+        assert con.in_transaction
+    assert not con.in_transaction
+    assert valores(con) == [1, 2]
+
+
+def test_bloque_interno_con_excepcion_no_revierte_al_externo(con):
+    with pytest.raises(ValueError):
+        with transaccion_escritura(con):
+            con.execute("INSERT INTO t VALUES (1)")
+            with transaccion_escritura(con):
+                con.execute("INSERT INTO t VALUES (2)")
+                raise ValueError("falla")
+    # La revierte el externo, que es el dueño de la transacción
+    assert not con.in_transaction
+    assert valores(con) == []
+
+
+def test_transaccion_ya_abierta_no_se_confirma_ni_revierte(con):
+    con.execute("INSERT INTO t VALUES (1)")  # BEGIN implícito de sqlite3
+    assert con.in_transaction
+
+    with transaccion_escritura(con):
+        con.execute("INSERT INTO t VALUES (2)")
+    assert con.in_transaction
+
+    with pytest.raises(ValueError):
+        with transaccion_escritura(con):
+            con.execute("INSERT INTO t VALUES (3)")
+            raise ValueError("falla")
+    assert con.in_transaction
+
+    # La decisión es de quien abrió la transacción
+    con.rollback()
+    assert valores(con) == []
+
+
+def test_excepciones_del_interprete_no_pasan_por_rollback(con):
+    with pytest.raises(KeyboardInterrupt):
+        with transaccion_escritura(con):
+            con.execute("INSERT INTO t VALUES (1)")
+            raise KeyboardInterrupt
+    assert con.in_transaction
+    con.rollback()
@@ -276,3 +276,66 @@ def test_trazabilidad_auditoria_factura_completa(repos, db_connection):
     
     assert eventos_final > eventos_post_cot
     assert hashes_final > hashes_post_cot
+
+
+def test_trazabilidad_auditoria_sql_equivale_a_auditoria_completa(repos, db_connection):
+    """
+    Verifica que la auditoría en una sola consulta da el mismo resultado
+    que la verificación registro por registro.
+    """
+    from crm_exo_v2.core.repository_trazabilidad import HashRepository
+    
+    e, c, p, o, cot, oc = (
+        repos["empresa"], repos["contacto"], repos["prospecto"],
+        repos["oportunidad"], repos["cotizacion"], repos["oc"]
+    )
+    hash_repo = HashRepository(conn=db_connection)
+    
+    id_empresa = e.crear_empresa(nombre="Auditoría SQL SA")
+    id_contacto = c.crear_contacto(id_empresa=id_empresa, nombre="Sql", correo="sql@audit.mx")
+    id_prospecto = p.crear_desde_empresa(id_empresa)
+    id_opp = o.crear_oportunidad(id_prospecto, "Auditoría SQL", 12000)
+    cot.crear_cotizacion(id_opp, 12000, modo="minimo", fuente="manual")
+    oc.crear_oc(id_oportunidad=id_opp, numero_oc="OC-SQL", monto_oc=12000)
+    
+    # Registro con hash pero sin evento en historial_general
+    db_connection.execute("""
+        INSERT INTO hash_registros (tabla_origen, id_registro, hash_sha256)
+        VALUES ('huerfano', 999, ?)
+    """, ("0" * 64,))
+    # Hash alterado para una entidad con eventos
+    db_connection.execute("""
+        INSERT INTO hash_registros (tabla_origen, id_registro, hash_sha256)
+        VALUES ('oportunidad', ?, ?)
+    """, (id_opp, "f" * 64))
+    db_connection.commit()
+    
+    esperado = hash_repo.auditoria_completa()
+    obtenido = hash_repo.auditoria_completa_sql()
+    
+    assert obtenido["sin_datos"] >= 1
+    assert obtenido["integridad_error"] >= 1
+    for clave in ("total_verificados", "integridad_ok", "integridad_error", "sin_datos"):
+        assert obtenido[clave] == esperado[clave]
+    assert sorted(d["hash_completo_registro"] for d in obtenido["detalles"]) == \
+        sorted(d["hash_completo_registro"] for d in esperado["detalles"])
+
+
+def test_trazabilidad_listar_eventos_paginado(repos, db_connection):
+    """
+    Verifica que listar_eventos pagina con offset sin repetir eventos.
+    """
+    from crm_exo_v2.core.repository_trazabilidad import HistorialGeneralRepository
+    
+    e = repos["empresa"]
+    h_repo = HistorialGeneralRepository(conn=db_connection)
+    
+    for i in range(5):
+        e.crear_empresa(nombre=f"Paginación {i} SA")
+    
+    todos = h_repo.listar_eventos(1000)
+    pagina_1 = h_repo.listar_eventos(2)
+    pagina_2 = h_repo.listar_eventos(2, offset=2)
+    
+    assert [ev["id_evento"] for ev in pagina_1 + pagina_2] == [ev["id_evento"] for ev in todos[:4]]
+    assert h_repo.listar_eventos(2, offset=len(todos)) == []